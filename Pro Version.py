@@ -1,16 +1,28 @@
-import os
-import win32print
 import tkinter as tk
 from tkinter import ttk, messagebox
-import json
-import socket
+import storage
+import label_core
+import print_queue
+import kit_batch
+import catalog_search
 
 # Default printer name (can be changed by the user)
 default_printer_name = "Zebra"
 
+# Layout used for labels, see zpl_templates.py
+label_layout = 'text_only'
+
+# Wait for TCP/IP printers to confirm each print (~HS host status), pausing
+# while they report paper out, an open head and the like
+confirm_prints = True
+
 # Path to the JSON file that stores label data
 label_data_path = "label_data.json"
 
+# Catalog storage backend: "json" (label_data_path) or "sqlite" (label_db_path)
+storage_backend = "json"
+label_db_path = "label_data.db"
+
 class LabelPrintApp(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -18,7 +30,15 @@ class LabelPrintApp(tk.Tk):
         self.title("Label Print App")
         self.geometry("800x600")
 
+        self.label_storage = storage.open_storage(storage_backend, label_data_path, label_db_path)
         self.label_data = self.load_label_data()
+        # Built on the first search
+        self.part_search = catalog_search.SearchIndex()
+
+        # Prints are sent by a background worker per printer, so a slow or
+        # paused printer never blocks the window
+        self.printers = {}
+        self.print_jobs = print_queue.PrintQueue(self.send_zpl_to_printer)
 
         self.printer_name_var = tk.StringVar(value=default_printer_name)
         self.printer_ip_var = tk.StringVar()
@@ -82,6 +102,13 @@ class LabelPrintApp(tk.Tk):
         part_canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
 
+        # Narrows the kit list to kits whose number, parts or descriptions match
+        self.kit_search_var = tk.StringVar()
+        tk.Label(tab, text="Find Kit or Part:").pack(pady=(10, 0))
+        kit_search_entry = tk.Entry(tab, textvariable=self.kit_search_var)
+        kit_search_entry.pack()
+        kit_search_entry.bind("<KeyRelease>", self.filter_kits)
+
         tk.Label(tab, text="Select Kit:").pack(pady=10)
         self.kit_select = ttk.Combobox(tab, textvariable=self.kit_number_var, state="readonly")
         self.kit_select['values'] = list(self.label_data.keys())
@@ -92,6 +119,14 @@ class LabelPrintApp(tk.Tk):
         tk.Button(tab, text="Print Selected Parts", command=self.print_selected_parts).pack(pady=10)
         tk.Label(tab, textvariable=self.message_var).pack(pady=10)
 
+    def filter_kits(self, event=None):
+        query = self.kit_search_var.get()
+        if not query.strip():
+            self.kit_select['values'] = list(self.label_data.keys())
+            return
+        results = self.part_search.sync(self.label_data).search(query, limit=200)
+        self.kit_select['values'] = list(dict.fromkeys(kit_number for kit_number, _, _ in results))
+
     def toggle_tcp_ip(self):
         if self.use_tcp_ip_var.get():
             self.ip_entry.config(state=tk.NORMAL)
@@ -137,18 +172,27 @@ class LabelPrintApp(tk.Tk):
             self.message_var.set("Please select at least one part.")
             return
 
-        zpl_code = ""
-        for part in selected_parts:
-            part_data = self.label_data[selected_kit][part]
-            zpl_code += self.generate_zpl(part_data['part_number'], part_data['description']) + "\n"
+        parts = self.label_data[selected_kit]
+        batch = label_core.label_batch(parts[part] for part in selected_parts)
+        zpl_code = label_core.render_batch(label_layout, batch)
 
         if zpl_code:
-            print(f"Sending ZPL to printer:\n{zpl_code}")  # Debug statement
-            try:
-                self.send_zpl_to_printer(zpl_code.strip())
-                self.message_var.set("Selected parts printed successfully!")
-            except Exception as e:
-                self.message_var.set(f"Failed to print selected parts. Error: {e}")
+            job = self.print_jobs.submit(self.current_printer(), zpl_code, f"Selected parts from kit {selected_kit}",
+                                         label_core.batch_label_count(batch))
+            self.message_var.set("Selected parts queued for printing.")
+            self.watch_print_job(job)
+
+    def watch_print_job(self, job):
+        # Jobs finish on the queue's worker thread; follow them from the Tk loop
+        if job.status == 'done':
+            self.message_var.set("Selected parts printed successfully!")
+        elif job.status == 'failed':
+            self.message_var.set(f"Failed to print selected parts. Error: {job.error}")
+        else:
+            if job.status == 'paused':
+                self.message_var.set(f"Printing paused: {job.error}. "
+                                     f"{job.labels_printed or 0} of {job.label_count} labels printed.")
+            self.after(500, self.watch_print_job, job)
 
     def create_admin_tab(self, tab):
         self.kit_number_admin_var = tk.StringVar()
@@ -172,45 +216,100 @@ class LabelPrintApp(tk.Tk):
         self.admin_frame = tk.Frame(tab)
         self.admin_frame.grid(row=3, column=0, columnspan=3, sticky="nsew")
 
+        admin_buttons = tk.Frame(tab)
+        admin_buttons.grid(row=4, column=0, columnspan=3, pady=5)
+        tk.Button(admin_buttons, text="Delete", command=lambda: self.admin_selection_action(self.delete_label_data)).pack(side="left", padx=5)
+        tk.Button(admin_buttons, text="Up", command=lambda: self.admin_selection_action(self.move_label_data, 'up')).pack(side="left", padx=5)
+        tk.Button(admin_buttons, text="Down", command=lambda: self.admin_selection_action(self.move_label_data, 'down')).pack(side="left", padx=5)
+
         tab.grid_rowconfigure(3, weight=1)
         tab.grid_columnconfigure(0, weight=1)
         tab.grid_columnconfigure(1, weight=1)
         tab.grid_columnconfigure(2, weight=1)
 
-        # Add a scrollbar to the admin frame
-        self.admin_canvas = tk.Canvas(self.admin_frame)
-        self.scrollbar = ttk.Scrollbar(self.admin_frame, orient="vertical", command=self.admin_canvas.yview)
-        self.scrollable_frame = ttk.Frame(self.admin_canvas)
-
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.admin_canvas.configure(
-                scrollregion=self.admin_canvas.bbox("all")
-            )
-        )
-
-        self.admin_canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.admin_canvas.configure(yscrollcommand=self.scrollbar.set)
-
-        self.admin_canvas.pack(side="left", fill="both", expand=True)
+        # One Treeview instead of four widgets per part. Kit rows get their
+        # part rows only when first expanded, and edits update just the rows
+        # they touch.
+        self.admin_tree = ttk.Treeview(self.admin_frame, columns=("description",), selectmode="browse")
+        self.admin_tree.heading("#0", text="Kit / Part")
+        self.admin_tree.heading("description", text="Description")
+        self.admin_tree.bind("<<TreeviewOpen>>", self.load_admin_kit_parts)
+        self.scrollbar = ttk.Scrollbar(self.admin_frame, orient="vertical", command=self.admin_tree.yview)
+        self.admin_tree.configure(yscrollcommand=self.scrollbar.set)
+
+        self.admin_tree.pack(side="left", fill="both", expand=True)
         self.scrollbar.pack(side="right", fill="y")
 
         self.update_admin_tab()
 
     def update_admin_tab(self):
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-
-        row = 0
-        for kit_number, parts in self.label_data.items():
-            tk.Label(self.scrollable_frame, text=f"{kit_number}", font=('Arial', 12, 'bold')).grid(row=row, column=0, sticky="w", pady=5, columnspan=4)
-            row += 1
-            for part_number, part_data in parts.items():
-                tk.Button(self.scrollable_frame, text="Delete", command=lambda kn=kit_number, pn=part_number: self.delete_label_data(kn, pn)).grid(row=row, column=0, padx=5)
-                tk.Button(self.scrollable_frame, text="Up", command=lambda kn=kit_number, pn=part_number: self.move_label_data(kn, pn, 'up')).grid(row=row, column=1, padx=5)
-                tk.Button(self.scrollable_frame, text="Down", command=lambda kn=kit_number, pn=part_number: self.move_label_data(kn, pn, 'down')).grid(row=row, column=2, padx=5)
-                tk.Label(self.scrollable_frame, text=f"{part_data['part_number']} - {part_data['description']}", anchor="w").grid(row=row, column=3, sticky="w", padx=5)
-                row += 1
+        # Full rebuild, only needed on startup
+        self.admin_tree.delete(*self.admin_tree.get_children())
+        self.admin_kit_rows = {}
+        self.admin_part_rows = {}
+        self.admin_row_parts = {}
+        self.admin_loaded_kits = set()
+        for kit_number in self.label_data:
+            self.add_admin_kit_row(kit_number)
+
+    def add_admin_kit_row(self, kit_number):
+        row = self.admin_tree.insert("", "end", text=kit_number, open=False)
+        # Placeholder child so the kit can be expanded before its parts are loaded
+        self.admin_tree.insert(row, "end", text="...")
+        self.admin_kit_rows[kit_number] = row
+        return row
+
+    def load_admin_kit_parts(self, event=None):
+        row = self.admin_tree.focus()
+        kit_number = self.admin_tree.item(row, "text")
+        if self.admin_kit_rows.get(kit_number) != row or kit_number in self.admin_loaded_kits:
+            return
+        self.admin_tree.delete(*self.admin_tree.get_children(row))
+        for part_number, part_data in self.label_data.get(kit_number, {}).items():
+            self.add_admin_part_row(kit_number, part_number, part_data)
+        self.admin_loaded_kits.add(kit_number)
+
+    def add_admin_part_row(self, kit_number, part_number, part_data):
+        row = self.admin_tree.insert(self.admin_kit_rows[kit_number], "end", text=part_data['part_number'],
+                                     values=(part_data['description'],))
+        self.admin_part_rows[(kit_number, part_number)] = row
+        self.admin_row_parts[row] = (kit_number, part_number)
+        return row
+
+    def refresh_admin_part(self, kit_number, part_number):
+        # Updates the tree after one part was stored, deleted or moved
+        parts = self.label_data.get(kit_number)
+        if not parts:
+            kit_row = self.admin_kit_rows.pop(kit_number, None)
+            if kit_row is not None:
+                self.admin_tree.delete(kit_row)
+            row = self.admin_part_rows.pop((kit_number, part_number), None)
+            self.admin_row_parts.pop(row, None)
+            self.admin_loaded_kits.discard(kit_number)
+            return
+        kit_row = self.admin_kit_rows.get(kit_number) or self.add_admin_kit_row(kit_number)
+        if kit_number not in self.admin_loaded_kits:
+            # Parts are read when the kit is expanded
+            return
+        row = self.admin_part_rows.get((kit_number, part_number))
+        part_data = parts.get(part_number)
+        if part_data is None:
+            if row is not None:
+                self.admin_tree.delete(row)
+                del self.admin_part_rows[(kit_number, part_number)]
+                del self.admin_row_parts[row]
+            return
+        if row is None:
+            row = self.add_admin_part_row(kit_number, part_number, part_data)
+        self.admin_tree.item(row, text=part_data['part_number'], values=(part_data['description'],))
+        self.admin_tree.move(row, kit_row, list(parts).index(part_number))
+
+    def admin_selection_action(self, action, *args):
+        part = self.admin_row_parts.get(self.admin_tree.focus())
+        if part is None:
+            messagebox.showerror("Error", "Select a part first.")
+            return
+        action(*part, *args)
 
     def store_label_data(self):
         kit_number = self.kit_number_admin_var.get()
@@ -221,109 +320,52 @@ class LabelPrintApp(tk.Tk):
             messagebox.showerror("Error", "All fields are required.")
             return
 
-        if kit_number not in self.label_data:
-            self.label_data[kit_number] = {}
-
-        self.label_data[kit_number][part_number] = {
-            "part_number": part_number,
-            "description": description
-        }
-        self.save_label_data()
+        self.label_storage.store_part(kit_number, part_number, kit_batch.part_entry(part_number, description))
+        self.label_data = self.load_label_data()
+        if self.part_search.source is not None:
+            self.part_search.sync(self.label_data).add(kit_number, part_number, description)
         self.kit_select['values'] = list(self.label_data.keys())
-        self.update_admin_tab()
+        self.refresh_admin_part(kit_number, part_number)
         messagebox.showinfo("Success", f"Part {part_number} added to kit {kit_number}.")
 
     def delete_label_data(self, kit_number, part_number):
-        if kit_number in self.label_data and part_number in self.label_data[kit_number]:
-            del self.label_data[kit_number][part_number]
-            if not self.label_data[kit_number]:
-                del self.label_data[kit_number]
-            self.save_label_data()
+        if self.label_storage.delete_part(kit_number, part_number):
+            self.label_data = self.load_label_data()
+            if self.part_search.source is not None:
+                self.part_search.sync(self.label_data).remove(kit_number, part_number)
             self.kit_select['values'] = list(self.label_data.keys())
-            self.update_admin_tab()
+            self.refresh_admin_part(kit_number, part_number)
             messagebox.showinfo("Success", f"Part {part_number} deleted from kit {kit_number}.")
         else:
             messagebox.showerror("Error", "Part not found in the specified kit.")
 
     def move_label_data(self, kit_number, part_number, direction):
-        if kit_number in self.label_data and part_number in self.label_data[kit_number]:
-            parts = list(self.label_data[kit_number].items())
-            index = parts.index((part_number, self.label_data[kit_number][part_number]))
-            if direction == 'up' and index > 0:
-                parts[index], parts[index - 1] = parts[index - 1], parts[index]
-            elif direction == 'down' and index < len(parts) - 1:
-                parts[index], parts[index + 1] = parts[index + 1], parts[index]
-            self.label_data[kit_number] = dict(parts)
-            self.save_label_data()
-            self.update_admin_tab()
+        if self.label_storage.move_part(kit_number, part_number, direction):
+            self.label_data = self.load_label_data()
+            self.refresh_admin_part(kit_number, part_number)
             messagebox.showinfo("Success", f"Part {part_number} moved {direction} in kit {kit_number}.")
         else:
             messagebox.showerror("Error", "Part not found in the specified kit.")
 
     def load_label_data(self):
-        if os.path.exists(label_data_path):
-            with open(label_data_path, 'r') as file:
-                return json.load(file)
-        return {}
-
-    def save_label_data(self):
-        with open(label_data_path, 'w') as file:
-            json.dump(self.label_data, file)
-
-    def generate_zpl(self, part_number, description):
-        # Constants for label and font dimensions
-        label_width = 609  # Width of the label in dots
-        char_width = 74    # Width of a single character in dots (based on font size)
-        description_width = 550  # Width for the description field block
-
-        # Calculate the width of the part number text
-        part_number_length = len(part_number)
-        total_text_width = part_number_length * char_width
-
-        # Calculate the centered position for the part number
-        centered_position = (label_width - total_text_width) // 2
-
-        # Adjust this value to fine-tune the left-right position
-        fine_tune_adjustment = -60  # Increase this value to move right, decrease to move left
-        final_position = centered_position + fine_tune_adjustment
-
-        zpl_template = (
-            f"^XA\n"
-            f"^PW609\n"
-            f"^LL0406\n"
-            f"^LS0\n"
-            f"^FO{final_position},50^A0N,74,76^FD{part_number}^FS\n"
-            f"^FO30,150^FB{description_width},5,10,C,0^A0N,28,28^FD{description}^FS\n"
-            f"^PQ1,0,1,Y\n"
-            f"^XZ"
-        )
-        return zpl_template.format(part_number=part_number, description=description)
+        return self.label_storage.load()
 
-    def send_zpl_to_printer(self, zpl_code):
+    def current_printer(self):
+        # The printer picked in the Main tab, as a key into self.printers
         if self.use_tcp_ip_var.get():
-            printer_ip = self.printer_ip_var.get()
-            try:
-                # Send ZPL to the TCP/IP printer
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.connect((printer_ip, 9100))
-                sock.sendall(zpl_code.encode())
-                sock.close()
-            except Exception as e:
-                raise Exception(f"Failed to print to TCP/IP printer at {printer_ip}: {e}")
+            # TCP/IP printer over the pooled connection
+            name = f"tcp:{self.printer_ip_var.get()}"
+            printer = label_core.direct_printer(self.printer_ip_var.get(), confirm=confirm_prints)
         else:
-            # Send ZPL to the USB printer
-            printer_name = self.printer_name_var.get()
-            hPrinter = win32print.OpenPrinter(printer_name)
-            try:
-                hJob = win32print.StartDocPrinter(hPrinter, 1, ("ZPL Label", None, "RAW"))
-                try:
-                    win32print.StartPagePrinter(hPrinter)
-                    win32print.WritePrinter(hPrinter, zpl_code.encode())
-                    win32print.EndPagePrinter(hPrinter)
-                finally:
-                    win32print.EndDocPrinter(hPrinter)
-            finally:
-                win32print.ClosePrinter(hPrinter)
+            # USB printer through its Windows print queue
+            name = f"usb:{self.printer_name_var.get()}"
+            printer = label_core.direct_printer(self.printer_name_var.get(), usb=True)
+        self.printers.setdefault(name, printer)
+        return name
+
+    def send_zpl_to_printer(self, printer_name, zpl_code, progress=None):
+        # Runs on the print queue's worker thread
+        return label_core.send(self.printers[printer_name], zpl_code, label_layout, progress)
 
 if __name__ == "__main__":
     app = LabelPrintApp()
@@ -1,27 +1,94 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, make_response
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, make_response, Response, stream_with_context, send_file, abort
+import codecs
 import json
 import os
-import requests
 from functools import wraps
+import storage
+import label_core
+import print_queue
+import printer_fleet
+import printer_monitor
+import printer_transport
+import catalog_search
+import kit_batch
+import metrics
+import bulk_print
+import zpl_preview
 
 app = Flask(__name__)
-app.secret_key = 'your_secret_key'  # Replace with a random secret key
+# Set ZPL_PRINT_SECRET_KEY in production; the default key is not secret
+app.secret_key = os.environ.get('ZPL_PRINT_SECRET_KEY', 'your_secret_key')
 
-# Single printer IP address
+# Development server debug mode (python app.py); never enabled under wsgi.py
+debug = os.environ.get('ZPL_PRINT_DEBUG', '1') == '1'
+
+# Single printer IP address, used when there is no printers.json
 printer_ip = "xxx.xxx.xxx.xxx"
 
+# Download the label layout to each printer once (^DF stored format) and send
+# labels as short recalls with only the field data. Printers in printers.json
+# can override this with "stored_formats".
+use_stored_formats = False
+
+# Check ~HS host status around every job and wait for its labels to print,
+# so paper out or an open head pauses the printer's queue instead of losing
+# the labels. Printers in printers.json can override this with "confirm".
+confirm_prints = True
+
+# Printer fleet definition, see printer_fleet.py for the format
+printers_path = "printers.json"
+printer_registry = printer_fleet.load_registry(printers_path, default_address=printer_ip,
+                                               stored_formats=use_stored_formats, confirm=confirm_prints)
+
+# Layout used for web prints, see zpl_templates.py
+label_layout = 'standard'
+
+# Label size in dots produced by generate_zpl (^PW/^LL); jobs are only routed
+# to printers loaded with this stock
+label_size = (609, 406)
+
 # Path to the JSON file that stores label data
 label_data_path = "label_data.json"
 
+# Catalog storage backend: "json" (label_data_path) or "sqlite" (label_db_path).
+# The first start on sqlite imports the existing JSON file.
+storage_backend = "json"
+label_db_path = "label_data.db"
+label_storage = storage.open_storage(storage_backend, label_data_path, label_db_path)
+
+# Kit and part listings are served a page at a time: the print page fetches
+# them from /kits and /kits/parts, the admin page shows admin_page_size kits
+page_size = 50
+max_page_size = 500
+admin_page_size = 20
+
+# Stage timings, per-printer counters, error counts and catalog cache counts
+# are served on /metrics; set log_job_timings to also log one JSON timing
+# record per print job
+log_job_timings = False
+metrics.log_job_timings = log_job_timings
+
 def load_label_data():
-    if os.path.exists(label_data_path):
-        with open(label_data_path, 'r') as file:
-            return json.load(file)
-    return {}
+    # Served from memory; the backend only re-reads when the catalog changes
+    with metrics.stage('load_label_data'):
+        return label_storage.load()
 
 def save_label_data(label_data):
-    with open(label_data_path, 'w') as file:
-        json.dump(label_data, file)
+    label_storage.replace_all(label_data)
+
+# Search over kits and parts, built on the first search and then kept current
+# by the admin handlers. load() returns a new dict once another process has
+# changed the catalog, which makes the index rebuild.
+part_search = catalog_search.SearchIndex()
+max_search_results = 100
+
+def current_search_index():
+    return part_search.sync(load_label_data())
+
+def page_args():
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = min(max_page_size, max(1, request.args.get('per_page', page_size, type=int)))
+    return page, per_page
 
 def login_required(f):
     @wraps(f)
@@ -33,13 +100,50 @@ def login_required(f):
 
 @app.route('/')
 def index():
-    printer_status = check_printer_status(printer_ip)
-    label_data = load_label_data()
+    printer_status = {printer.name: check_printer_status(printer.name) for printer in printer_registry.all()}
     message = request.args.get('message')
-    response = make_response(render_template('index.html', printer_status=printer_status, label_data=label_data, message=message))
+    response = make_response(render_template('index.html', printer_status=printer_status, message=message,
+                                             printers=printer_registry.all(), pools=printer_registry.pools()))
     response.headers['Cache-Control'] = 'no-store'
     return response
 
+@app.route('/kits')
+def list_kits():
+    page, per_page = page_args()
+    kits, total = label_storage.list_kits((page - 1) * per_page, per_page)
+    return jsonify({'kits': [{'kit_number': kit_number, 'part_count': part_count} for kit_number, part_count in kits],
+                    'page': page, 'per_page': per_page, 'total': total})
+
+@app.route('/kits/parts')
+def list_kit_parts():
+    kit_number = request.args.get('kit_number')
+    page, per_page = page_args()
+    result = label_storage.list_parts(kit_number, (page - 1) * per_page, per_page)
+    if result is None:
+        return jsonify({'message': f"Kit {kit_number} not found."}), 404
+    parts, total = result
+    return jsonify({'kit_number': kit_number, 'parts': parts, 'page': page, 'per_page': per_page, 'total': total})
+
+@app.route('/search')
+def search():
+    query = request.args.get('q', '')
+    limit = min(max_search_results, max(1, request.args.get('limit', 20, type=int)))
+    results = current_search_index().search(query, limit)
+    kits = list(dict.fromkeys(kit_number for kit_number, _, _ in results))
+    return jsonify({'query': query, 'kits': kits,
+                    'results': [{'kit_number': kit_number, 'part_number': part_number, 'description': description}
+                                for kit_number, part_number, description in results]})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/printer-status')
+def printer_status():
+    statuses = printer_health.statuses()
+    return jsonify({printer.name: dict(statuses.get(printer.name) or {}, status=check_printer_status(printer.name))
+                    for printer in printer_registry.all()})
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -58,8 +162,28 @@ def logout():
 @app.route('/admin')
 @login_required
 def admin():
-    label_data = load_label_data()
-    return render_template('admin.html', label_data=label_data)
+    page = max(1, request.args.get('page', 1, type=int))
+    kits, total = label_storage.list_kits((page - 1) * admin_page_size, admin_page_size)
+    label_data = {kit_number: label_storage.get_kit(kit_number) for kit_number, _ in kits}
+    page_count = max(1, (total + admin_page_size - 1) // admin_page_size)
+    return render_template('admin.html', label_data=label_data, page=page, page_count=page_count)
+
+def admin_redirect():
+    # Back to the admin page the form was posted from
+    return redirect(url_for('admin', page=request.form.get('page', 1, type=int)))
+
+@app.route('/admin/preview')
+@login_required
+def preview_label():
+    # PNG preview of a part's label, rendered once per distinct ZPL
+    kit_number = request.args.get('kit_number')
+    part_number = request.args.get('part_number')
+    part_data = load_label_data().get(kit_number, {}).get(part_number)
+    if part_data is None:
+        abort(404)
+    path = zpl_preview.preview_path(generate_zpl(part_data['part_number'], part_data['description'],
+                                                 fit=label_core.part_fit(part_data)))
+    return send_file(os.path.abspath(path), mimetype='image/png', max_age=3600)
 
 @app.route('/admin/store', methods=['POST'])
 @login_required
@@ -67,17 +191,13 @@ def store_label_data():
     kit_number = request.form['kit_number']
     part_number = request.form['part_number']
     description = request.form['description']
+    quantity = max(1, request.form.get('quantity', 1, type=int))
 
-    label_data = load_label_data()
-    if kit_number not in label_data:
-        label_data[kit_number] = {}
-    label_data[kit_number][part_number] = {
-        "part_number": part_number,
-        "description": description
-    }
-    save_label_data(label_data)
+    label_storage.store_part(kit_number, part_number, kit_batch.part_entry(part_number, description, quantity))
+    if part_search.source is not None:
+        current_search_index().add(kit_number, part_number, description)
 
-    return redirect(url_for('admin'))
+    return admin_redirect()
 
 @app.route('/admin/delete', methods=['POST'])
 @login_required
@@ -85,14 +205,10 @@ def delete_label_data():
     kit_number = request.form['kit_number']
     part_number = request.form['part_number']
 
-    label_data = load_label_data()
-    if kit_number in label_data and part_number in label_data[kit_number]:
-        del label_data[kit_number][part_number]
-        if not label_data[kit_number]:
-            del label_data[kit_number]
-        save_label_data(label_data)
+    if label_storage.delete_part(kit_number, part_number) and part_search.source is not None:
+        current_search_index().remove(kit_number, part_number)
 
-    return redirect(url_for('admin'))
+    return admin_redirect()
 
 @app.route('/admin/move', methods=['POST'])
 @login_required
@@ -101,18 +217,73 @@ def move_label_data():
     part_number = request.form['part_number']
     direction = request.form['direction']
 
+    label_storage.move_part(kit_number, part_number, direction)
+
+    return admin_redirect()
+
+@app.route('/admin/bulk', methods=['POST'])
+@login_required
+def bulk_label_data():
+    # JSON body {"kit_number": ..., "add": [part, ...], "delete": [part_number, ...],
+    # "order": [part_number, ...]}, all optional but kit_number. The batch is
+    # validated against the current kit and written as one storage write.
+    batch = request.get_json(silent=True)
+    if not isinstance(batch, dict) or not batch.get('kit_number'):
+        return jsonify({'message': "Expected a JSON object with a kit_number."}), 400
+    kit_number = batch['kit_number']
+    if not isinstance(kit_number, str):
+        return jsonify({'message': "kit_number must be a string."}), 400
+    try:
+        # Validated against the kit as it is inside the write, so a concurrent
+        # edit of the same kit is never overwritten
+        parts = label_storage.update_kit(kit_number, lambda parts: kit_batch.apply_batch(
+            parts, batch.get('add') or (), batch.get('delete') or (), batch.get('order')))
+    except kit_batch.BatchError as e:
+        return jsonify({'message': str(e)}), 400
+
+    if part_search.source is not None:
+        current_search_index().replace_kit(kit_number, parts)
+    return jsonify({'message': f"Kit {kit_number} updated.", 'kit_number': kit_number, 'part_count': len(parts)})
+
+@app.route('/admin/export')
+@login_required
+def export_label_data():
+    # ?kit_number=... (repeatable, default every kit) &format=csv|jsonl|json
+    file_format = request.args.get('format', 'csv')
+    if file_format not in ('csv', 'jsonl', 'json'):
+        return jsonify({'message': f"Unknown export format: {file_format}"}), 400
     label_data = load_label_data()
-    if kit_number in label_data and part_number in label_data[kit_number]:
-        parts = list(label_data[kit_number].items())
-        index = parts.index((part_number, label_data[kit_number][part_number]))
-        if direction == 'up' and index > 0:
-            parts[index], parts[index - 1] = parts[index - 1], parts[index]
-        elif direction == 'down' and index < len(parts) - 1:
-            parts[index], parts[index + 1] = parts[index + 1], parts[index]
-        label_data[kit_number] = dict(parts)
-        save_label_data(label_data)
-
-    return redirect(url_for('admin'))
+    kit_numbers = request.args.getlist('kit_number') or list(label_data)
+    kits = {kit_number: label_data[kit_number] for kit_number in kit_numbers if kit_number in label_data}
+    response = make_response(kit_batch.export_kits(kits, file_format))
+    response.headers['Content-Type'] = 'application/json' if file_format == 'json' else (
+        'application/x-ndjson' if file_format == 'jsonl' else 'text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename=kits.{file_format}'
+    return response
+
+@app.route('/admin/import', methods=['POST'])
+@login_required
+def import_label_data():
+    # Uploaded "file" in an export format; every kit in it replaces the stored
+    # kit of the same number, all in one storage write
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'message': "No file uploaded."}), 400
+    file_format = request.form.get('format') or (
+        'json' if upload.filename.endswith('.json') else
+        'jsonl' if upload.filename.endswith(('.jsonl', '.ndjson')) else 'csv')
+    try:
+        kits = kit_batch.import_kits(codecs.iterdecode(upload.stream, 'utf-8-sig'), file_format)
+    except kit_batch.BatchError as e:
+        return jsonify({'message': str(e)}), 400
+
+    label_storage.replace_kits(kits)
+    if part_search.source is not None:
+        search_index = current_search_index()
+        for kit_number, parts in kits.items():
+            search_index.replace_kit(kit_number, parts)
+    return jsonify({'message': f"Imported {sum(len(parts) for parts in kits.values())} parts in {len(kits)} kits.",
+                    'kit_count': len(kits)})
 
 @app.route('/print', methods=['POST'])
 def print_label():
@@ -120,97 +291,171 @@ def print_label():
     message = None
 
     label_data = load_label_data()
-    zpl_code = ""
+    labels = []
     if selected_kit in label_data:
-        for part, part_data in label_data[selected_kit].items():
-            zpl_code += generate_zpl(part_data['part_number'], part_data['description']) + "\n"
+        labels = list(label_data[selected_kit].values())
     else:
         return jsonify({'message': f"Kit {selected_kit} not found."})
 
-    if zpl_code:
-        try:
-            response = send_zpl_to_printer(zpl_code)
-            if response.status_code == 200:
-                message = f"Kit {selected_kit} printed successfully!"
-            else:
-                message = f"Failed to print kit. Status code: {response.status_code}"
-        except Exception as e:
-            message = f"Failed to print kit. Error: {e}"
+    job_ids = []
+    if labels:
+        jobs = submit_labels(labels, f"Kit {selected_kit}")
+        if not jobs:
+            return jsonify({'message': "No printer available for this label size."})
+        job_ids = [job.id for job in jobs]
+        message = f"Kit {selected_kit} queued for printing on {', '.join(job.printer for job in jobs)}."
 
-    return jsonify({'message': message})
+    return jsonify({'message': message, 'job_id': job_ids[0] if job_ids else None, 'job_ids': job_ids})
 
 @app.route('/print-selected-parts', methods=['POST'])
 def print_selected_parts():
-    selected_parts = request.form.getlist('part_numbers')
+    selected_parts = set(request.form.getlist('part_numbers'))
     selected_kit = request.form.get('kit_number_parts')
+    # The print page loads a kit's parts a page at a time, all checked, and
+    # sends every part number it has shown as shown_parts. Parts on pages it
+    # has not loaded could not be unchecked, so they print as well.
+    shown_parts = set(request.form.getlist('shown_parts'))
     message = None
 
     label_data = load_label_data()
-    zpl_code = ""
+    labels = []
     if selected_kit in label_data:
-        for part in selected_parts:
-            if part in label_data[selected_kit]:
-                part_data = label_data[selected_kit][part]
-                zpl_code += generate_zpl(part_data['part_number'], part_data['description']) + "\n"
+        labels = [part_data for part_number, part_data in label_data[selected_kit].items()
+                  if part_number in selected_parts or (shown_parts and part_number not in shown_parts)]
     else:
         return jsonify({'message': f"Kit {selected_kit} not found."})
 
-    if zpl_code:
-        try:
-            response = send_zpl_to_printer(zpl_code)
-            if response.status_code == 200:
-                message = f"Selected parts from kit {selected_kit} printed successfully!"
-            else:
-                message = f"Failed to print selected parts. Status code: {response.status_code}"
-        except Exception as e:
-            message = f"Failed to print selected parts. Error: {e}"
-
-    return jsonify({'message': message})
-
-def generate_zpl(part_number, description):
-    # Constants for label and font dimensions
-    label_width = 609  # Width of the label in dots
-    char_width = 74    # Width of a single character in dots (based on font size)
-    description_width = 550  # Width for the description field block
-
-    # Calculate the width of the part number text
-    part_number_length = len(part_number)
-    total_text_width = part_number_length * char_width
-
-    # Calculate the centered position for the part number
-    centered_position = (label_width - total_text_width) // 2
-
-    # Adjust this value to fine-tune the left-right position
-    fine_tune_adjustment = 60 # Increase this value to move right, decrease to move left
-    final_position = centered_position - fine_tune_adjustment
-
-    zpl_template = f"""
-    ^XA
-    ^PW609
-    ^LL0406
-    ^LS0
-    ^FO{final_position},50^A0N,74,76^FD{{part_number}}^FS
-    ^FO30,150^FB{description_width},5,10,C,0^A0N,28,28^FD{{description}}^FS
-    ^FO50,300^BCN,100,Y,N,N
-    ^FD{{part_number}}^FS
-    ^PQ1,0,1,Y
-    ^XZ
-    """
-    return zpl_template.format(part_number=part_number, description=description)
-
-
-def send_zpl_to_printer(zpl_code):
-    url = f"http://{printer_ip}:9100"
-    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-    response = requests.post(url, data=zpl_code, headers=headers)
-    return response
-
-def check_printer_status(printer_ip):
-    response = os.system(f"ping -n 1 {printer_ip}")  # For Windows, use "ping -n 1 {printer_ip}"
-    if response == 0:
-        return "green"
+    job_ids = []
+    if labels:
+        jobs = submit_labels(labels, f"Selected parts from kit {selected_kit}")
+        if not jobs:
+            return jsonify({'message': "No printer available for this label size."})
+        job_ids = [job.id for job in jobs]
+        message = f"Selected parts from kit {selected_kit} queued for printing on {', '.join(job.printer for job in jobs)}."
+
+    return jsonify({'message': message, 'job_id': job_ids[0] if job_ids else None, 'job_ids': job_ids})
+
+def submit_labels(labels, description):
+    # Routes a print request using the optional "printer" form field (a printer
+    # name or "pool:<tag>", default any printer). With "split" set the labels
+    # are spread across every healthy printer in the pool, otherwise they all
+    # go to the least busy one.
+    #
+    # labels are part_data dicts. Each part prints its catalog quantity times
+    # the "copies" form field, and runs of identical or counting labels are
+    # collapsed into single ^PQ/^SN formats before routing. Rendering happens
+    # once the printer is known, since that decides full format vs. recall.
+    copies = max(1, request.form.get('copies', 1, type=int))
+    batch = label_core.label_batch(labels, copies)
+
+    target = request.form.get('printer', '')
+    if request.form.get('split'):
+        runs = printer_scheduler.split(target, batch, label_size)
     else:
-        return "red"
+        printer = printer_scheduler.pick(target, label_size)
+        runs = [(printer, batch)] if printer is not None else []
+    jobs = []
+    for printer, run in runs:
+        with metrics.stage('generate_zpl'):
+            zpl_code = label_core.render_batch(label_layout, run, printer.stored_formats)
+        jobs.append(print_jobs.submit(printer.name, zpl_code, description, label_core.batch_label_count(run)))
+    return jobs
+
+@app.route('/print/bulk', methods=['POST'])
+def print_bulk():
+    # Streams a CSV or JSONL job file (uploaded as "file" or sent as the raw
+    # request body) to one printer, chunk by chunk through its print queue.
+    # The response is a stream of JSON lines reporting progress; on failure
+    # the last line carries the offset to resume from (?offset=N).
+    upload = request.files.get('file')
+    file_format = request.args.get('format') or request.form.get('format')
+    if file_format is None:
+        file_format = 'jsonl' if upload is not None and upload.filename.endswith(('.jsonl', '.ndjson')) else 'csv'
+    offset = request.args.get('offset', 0, type=int)
+    printer = printer_scheduler.pick(request.args.get('printer', ''), label_size)
+    if printer is None:
+        return jsonify({'message': "No printer available for this label size."}), 503
+
+    stream = upload.stream if upload is not None else request.stream
+    lines = codecs.iterdecode(stream, 'utf-8-sig')
+
+    def render(part_number, description, quantity, serial):
+        return generate_zpl(part_number, description, stored_format=printer.stored_formats,
+                            quantity=quantity, serial=serial)
+
+    def send(zpl_code, label_count):
+        # Each chunk is a job on the printer's queue, so it never interleaves
+        # with other jobs for that printer and confirmed label counts stay
+        # per job. The next chunk is only read once this one has printed.
+        job = print_jobs.submit(printer.name, zpl_code, "Bulk print", label_count)
+        job.wait()
+        if job.status == 'failed':
+            raise printer_transport.PrinterError(job.error)
+
+    def progress():
+        yield json.dumps({'printer': printer.name, 'offset': offset}) + "\n"
+        try:
+            for update in bulk_print.bulk_print(lines, file_format, load_label_data(), render, send, offset):
+                yield json.dumps(update) + "\n"
+        except bulk_print.BulkPrintError as e:
+            yield json.dumps({'error': str(e), 'resume_offset': e.resume_offset}) + "\n"
+            return
+        yield json.dumps({'done': True}) + "\n"
+
+    return Response(stream_with_context(progress()), mimetype='application/x-ndjson')
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = print_jobs.get(job_id)
+    if job is None:
+        return jsonify({'message': f"Job {job_id} not found."}), 404
+    return jsonify(job.to_dict())
+
+def generate_zpl(part_number, description, stored_format=False, quantity=1, serial=False, fit=None):
+    # Rendered from the precompiled layout; repeat labels come from the cache.
+    # See label_core.generate_zpl for the arguments.
+    with metrics.stage('generate_zpl'):
+        return label_core.generate_zpl(label_layout, part_number, description, stored_format, quantity, serial, fit)
+
+
+def send_zpl_to_printer(printer_name, zpl_code, progress=None):
+    # Raw ZPL over the printer's transport; raises PrinterError on failure.
+    # Returns the labels printed when the printer confirms jobs, else None.
+    # While the printer reports an error it is marked unhealthy, so new jobs
+    # go to other printers in its pool.
+    printer = printer_registry.get(printer_name)
+
+    def report(labels_printed, errors):
+        if errors:
+            printer_registry.mark_failed(printer_name)
+        if progress is not None:
+            progress(labels_printed, errors)
+
+    with metrics.stage('send_zpl_to_printer'):
+        try:
+            labels_printed = label_core.send(printer, zpl_code, label_layout, report)
+        except Exception:
+            printer_registry.mark_failed(printer_name)
+            raise
+    printer_registry.mark_ok(printer_name)
+    metrics.bytes_sent_total.inc(len(zpl_code), printer=printer_name)
+    return labels_printed
+
+# Print requests are queued and sent by a background worker per printer
+print_jobs = print_queue.PrintQueue(send_zpl_to_printer, on_finished=metrics.record_job)
+printer_scheduler = printer_fleet.PrinterScheduler(printer_registry, print_jobs)
+
+# Printers are probed in the background; status is served from memory
+printer_health = printer_monitor.PrinterMonitor(printer_registry, host_status=confirm_prints).start()
+
+def check_printer_status(printer_name):
+    with metrics.stage('check_printer_status'):
+        status = printer_health.status(printer_name)
+        if status is None or status['online'] is None:
+            return "grey"
+        if status['online'] and status['errors']:
+            return "orange"
+        return "green" if status['online'] else "red"
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='0.0.0.0', port=5000, debug=debug)
@@ -0,0 +1,179 @@
+import argparse
+import random
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+# A stand-in Zebra printer for benchmarks: accepts raw ZPL on a TCP port the
+# way a printer's 9100 port does and counts the labels it receives. Faults can
+# be injected to see how the app behaves against a struggling printer:
+#
+#   --latency S      sleep S seconds per label printed (print speed)
+#   --drop-rate P    close each connection with probability P per read
+#   --read-size N    read at most N bytes at a time (slow reads, TCP backpressure)
+#   --read-delay S   sleep S seconds between reads
+#   --paper-out-after N  report paper out (and stop counting labels) after N labels
+#
+# ~HS is answered with a host status reply reflecting paper_out, paused and
+# head_open, so status probes and error handling can be exercised. Like a real
+# printer, it keeps formats received while in an error state (and the rest of
+# the format it ran out of paper in) and prints them once clear_errors() is
+# called.
+#
+#   python bench/fake_printer.py --port 9100 --latency 0.01
+
+
+def host_status_reply(paper_out=False, paused=False, head_open=False, formats_in_buffer=0, labels_remaining=0):
+    return (f'\x02030,{paper_out:d},{paused:d},0609,{formats_in_buffer:03d},0,0,0,000,0,0,0\x03\r\n'
+            f'\x02000,0,{head_open:d},0,0,2,4,0,{labels_remaining:08d},1,000\x03\r\n'
+            '\x021234,0\x03\r\n').encode()
+
+
+class FakePrinter:
+    def __init__(self, host='127.0.0.1', port=9100, latency=0.0, drop_rate=0.0, read_size=65536, read_delay=0.0,
+                 paper_out_after=None):
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.read_size = read_size
+        self.read_delay = read_delay
+        self.paper_out_after = paper_out_after
+        self.paper_out = False
+        self.paused = False
+        self.head_open = False
+        self.held_formats = []  # labels per format waiting for an error to clear
+        self.labels_remaining = 0
+        self.stats = {'connections': 0, 'drops': 0, 'bytes': 0, 'formats': 0, 'labels': 0, 'status_queries': 0}
+        self._lock = threading.Lock()
+        printer = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                printer._handle(self.request)
+
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler, bind_and_activate=False)
+        self.server.daemon_threads = True
+        self.server.allow_reuse_address = True
+        self.server.server_bind()
+        self.server.server_activate()
+        self.address, self.port = self.server.server_address
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-printer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def clear_errors(self):
+        # The operator reloads paper / closes the head: held labels print
+        with self._lock:
+            self.paper_out = self.paused = self.head_open = False
+            self.paper_out_after = None
+            labels = self.labels_remaining + sum(self.held_formats)
+            self.stats['labels'] += labels
+            self.held_formats = []
+            self.labels_remaining = 0
+        if self.latency and labels:
+            time.sleep(self.latency * labels)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def _count(self, **amounts):
+        with self._lock:
+            for key, amount in amounts.items():
+                self.stats[key] += amount
+
+    def _handle(self, connection):
+        self._count(connections=1)
+        pending = b''
+        while True:
+            if self.drop_rate and random.random() < self.drop_rate:
+                self._count(drops=1)
+                connection.shutdown(socket.SHUT_RDWR)
+                return
+            try:
+                data = connection.recv(self.read_size)
+            except OSError:
+                return
+            if not data:
+                return
+            self._count(bytes=len(data))
+            pending += data
+
+            queries = pending.count(b'~HS')
+            if queries:
+                self._count(status_queries=queries)
+                with self._lock:
+                    reply = host_status_reply(self.paper_out, self.paused, self.head_open,
+                                              len(self.held_formats), self.labels_remaining)
+                connection.sendall(reply * queries)
+                pending = pending.replace(b'~HS', b'')
+
+            # Count complete formats; ^PQ<n> prints n labels
+            while True:
+                end = pending.find(b'^XZ')
+                if end == -1:
+                    break
+                label_format, pending = pending[:end], pending[end + 3:]
+                labels = 1
+                quantity_at = label_format.rfind(b'^PQ')
+                if quantity_at != -1:
+                    digits = label_format[quantity_at + 3:].split(b',')[0].strip()
+                    labels = int(digits) if digits.isdigit() else 1
+                if b'^DF' in label_format:
+                    # Stored format downloads print nothing
+                    labels = 0
+                with self._lock:
+                    if labels and (self.paper_out or self.paused or self.head_open):
+                        self.held_formats.append(labels)
+                        labels = 0
+                    elif self.paper_out_after is not None:
+                        printable = max(0, min(labels, self.paper_out_after - self.stats['labels']))
+                        if self.stats['labels'] + printable >= self.paper_out_after:
+                            self.paper_out = True
+                            self.labels_remaining = labels - printable
+                        labels = printable
+                self._count(formats=1, labels=labels)
+                if self.latency and labels:
+                    time.sleep(self.latency * labels)
+            if self.read_delay:
+                time.sleep(self.read_delay)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Zebra printer listening for raw ZPL.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds per label printed")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="probability of dropping the connection per read")
+    parser.add_argument('--read-size', type=int, default=65536, help="bytes read per recv")
+    parser.add_argument('--read-delay', type=float, default=0.0, help="seconds between reads")
+    parser.add_argument('--paper-out-after', type=int, help="labels printed before running out of paper")
+    parser.add_argument('--report', type=float, default=5.0, help="seconds between stats lines")
+    args = parser.parse_args(argv)
+
+    printer = FakePrinter(args.host, args.port, args.latency, args.drop_rate, args.read_size, args.read_delay,
+                          args.paper_out_after).start()
+    print(f"Fake printer listening on {printer.address}:{printer.port}", file=sys.stderr)
+    try:
+        last = printer.snapshot()
+        while True:
+            time.sleep(args.report)
+            stats = printer.snapshot()
+            rate = (stats['labels'] - last['labels']) / args.report
+            print(f"{stats} labels/s={rate:.1f}", file=sys.stderr)
+            last = stats
+    except KeyboardInterrupt:
+        printer.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
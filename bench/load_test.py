@@ -0,0 +1,148 @@
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from fake_printer import FakePrinter
+
+# Concurrent load driver for a running app.py. Worker threads pick requests
+# from a weighted mix (print a kit, list kits and parts, search, printer
+# status) for --duration seconds and report p50/p99 latency per endpoint plus
+# the labels per second the app sent, read from its /metrics counters.
+#
+# With --fake-printer PORT a fake printer is started in this process; point
+# the app's printers.json (or printer_ip) at 127.0.0.1:PORT to measure the
+# labels that actually arrived.
+#
+#   python bench/fake_printer.py --port 9100 &
+#   python bench/load_test.py --url http://127.0.0.1:5000 --threads 16 --duration 30
+
+default_mix = 'print=2,kits=2,parts=2,search=2,status=1'
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def labels_sent(base_url):
+    # Sum of zpl_labels_sent_total over every printer
+    with urllib.request.urlopen(base_url + '/metrics', timeout=10) as response:
+        text = response.read().decode()
+    return sum(float(value) for value in re.findall(r'^zpl_labels_sent_total\{[^}]*\} (\S+)$', text, re.M))
+
+
+class LoadTest:
+    def __init__(self, base_url, mix, kit_numbers, parts_per_print):
+        self.base_url = base_url.rstrip('/')
+        self.mix = mix
+        self.kit_numbers = kit_numbers
+        self.parts_per_print = parts_per_print
+        self.latencies = {name: [] for name, _ in mix}
+        self.errors = {name: 0 for name, _ in mix}
+        self._lock = threading.Lock()
+
+    def _request(self, path, data=None):
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+        with urllib.request.urlopen(self.base_url + path, data=body, timeout=30) as response:
+            return response.read()
+
+    def run_one(self, name, rng):
+        kit_number = rng.choice(self.kit_numbers)
+        if name == 'print':
+            parts = json.loads(self._request('/kits/parts?' + urllib.parse.urlencode(
+                {'kit_number': kit_number, 'per_page': self.parts_per_print})))['parts']
+            started = time.perf_counter()
+            self._request('/print-selected-parts', {'kit_number_parts': kit_number,
+                                                    'part_numbers': [part['part_number'] for part in parts]})
+        elif name == 'kits':
+            started = time.perf_counter()
+            self._request(f'/kits?page={rng.randint(1, max(1, len(self.kit_numbers) // 50))}')
+        elif name == 'parts':
+            started = time.perf_counter()
+            self._request('/kits/parts?' + urllib.parse.urlencode({'kit_number': kit_number}))
+        elif name == 'search':
+            started = time.perf_counter()
+            self._request('/search?' + urllib.parse.urlencode({'q': kit_number[:rng.randint(3, len(kit_number))]}))
+        else:
+            started = time.perf_counter()
+            self._request('/printer-status')
+        return time.perf_counter() - started
+
+    def worker(self, deadline, seed):
+        rng = random.Random(seed)
+        names = [name for name, _ in self.mix]
+        weights = [weight for _, weight in self.mix]
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            try:
+                elapsed = self.run_one(name, rng)
+            except (urllib.error.URLError, OSError, ValueError):
+                with self._lock:
+                    self.errors[name] += 1
+                continue
+            with self._lock:
+                self.latencies[name].append(elapsed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent load test against the label print web app.")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--mix', default=default_mix, help=f"weighted request mix (default {default_mix})")
+    parser.add_argument('--parts-per-print', type=int, default=20, help="parts selected per print request")
+    parser.add_argument('--fake-printer', type=int, metavar='PORT', help="start a fake printer on this port")
+    parser.add_argument('--printer-latency', type=float, default=0.0, help="fake printer seconds per label")
+    args = parser.parse_args(argv)
+
+    mix = [(name, float(weight)) for name, weight in (item.split('=') for item in args.mix.split(','))]
+    printer = FakePrinter(port=args.fake_printer, latency=args.printer_latency).start() if args.fake_printer else None
+
+    base_url = args.url.rstrip('/')
+    with urllib.request.urlopen(base_url + '/kits?per_page=500', timeout=10) as response:
+        kit_numbers = [kit['kit_number'] for kit in json.loads(response.read())['kits']]
+    if not kit_numbers:
+        print("The app's catalog is empty; generate one with bench/make_catalog.py", file=sys.stderr)
+        return 1
+
+    test = LoadTest(base_url, mix, kit_numbers, args.parts_per_print)
+    labels_before = labels_sent(base_url)
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=test.worker, args=(deadline, seed), daemon=True)
+               for seed in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Give the print queues a moment to drain before reading the counters
+    time.sleep(1)
+    elapsed = time.monotonic() - started
+    labels_after = labels_sent(base_url)
+
+    print(f"{'endpoint':<10} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, _ in mix:
+        latencies = test.latencies[name]
+        print(f"{name:<10} {len(latencies):>9} {test.errors[name]:>7} {len(latencies) / elapsed:>8.1f} "
+              f"{percentile(latencies, 0.5) * 1e3:>9.2f} {percentile(latencies, 0.99) * 1e3:>9.2f}")
+    print(f"labels sent by the app: {labels_after - labels_before:.0f} "
+          f"({(labels_after - labels_before) / elapsed:.1f} labels/s)")
+    if printer is not None:
+        stats = printer.snapshot()
+        print(f"labels received by the fake printer: {stats['labels']} ({stats['labels'] / elapsed:.1f} labels/s), "
+              f"{stats['connections']} connections, {stats['drops']} drops")
+        printer.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
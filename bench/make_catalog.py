@@ -0,0 +1,57 @@
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog
+import kit_batch
+import storage
+
+# Synthetic catalogs for benchmarks: N kits of M parts with realistic-looking
+# part numbers and descriptions, reproducible from --seed.
+#
+#   python bench/make_catalog.py --kits 1000 --parts 100 bench_catalog.json
+#   python bench/make_catalog.py --kits 1000 --parts 100 --backend sqlite bench_catalog.db
+
+_words = ("hex bolt nut washer bracket hinge panel cable clamp spring screw pin rivet gasket seal "
+          "cover plate mount housing shaft bearing spacer bushing stainless zinc plated steel "
+          "aluminium nylon m4 m5 m6 m8 10mm 20mm 40mm left right upper lower assembly").split()
+
+
+def make_catalog(kits, parts, seed=0):
+    rng = random.Random(seed)
+    label_data = {}
+    for kit_index in range(kits):
+        kit_number = f"KIT-{kit_index:05d}"
+        kit = {}
+        prefix = rng.choice(('PN', 'AS', 'FX', 'HW'))
+        for part_index in range(parts):
+            part_number = f"{prefix}-{kit_index:05d}-{part_index:03d}"
+            description = ' '.join(rng.choice(_words) for _ in range(rng.randint(3, 12)))
+            kit[part_number] = kit_batch.part_entry(part_number, description, rng.choice((1, 1, 1, 2, 5)))
+        label_data[kit_number] = kit
+    return label_data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic label catalog.")
+    parser.add_argument('path')
+    parser.add_argument('--kits', type=int, default=1000)
+    parser.add_argument('--parts', type=int, default=100, help="parts per kit")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backend', choices=['json', 'sqlite'], default='json')
+    args = parser.parse_args(argv)
+
+    label_data = make_catalog(args.kits, args.parts, args.seed)
+    if args.backend == 'json':
+        catalog.save_label_data(label_data, args.path)
+    else:
+        storage.SqliteStorage(args.path).replace_all(label_data)
+    print(f"Wrote {args.kits} kits x {args.parts} parts to {args.path}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
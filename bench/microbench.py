@@ -0,0 +1,123 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog
+import catalog_search
+import font_metrics
+import kit_batch
+import storage
+import zpl_templates
+from make_catalog import make_catalog
+
+# Microbenchmarks for the hot paths: ZPL rendering, label fitting, catalog
+# load/save on both storage backends and search. Each line reports the best
+# of --repeat runs, per operation.
+#
+#   python bench/microbench.py --kits 200 --parts 50
+
+
+def best_of(repeat, number, function):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = (time.perf_counter() - started) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def report(name, seconds, items=1):
+    per_item = seconds / items
+    print(f"{name:<42} {seconds * 1e3:10.3f} ms   {per_item * 1e6:10.2f} us/item   {items / seconds:12.0f} items/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks for rendering and catalog storage.")
+    parser.add_argument('--kits', type=int, default=200)
+    parser.add_argument('--parts', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    label_data = make_catalog(args.kits, args.parts)
+    labels = [(part_data['part_number'], part_data['description'], part_data['quantity'], tuple(part_data['fit']))
+              for parts in label_data.values() for part_data in parts.values()]
+    count = len(labels)
+    print(f"{args.kits} kits x {args.parts} parts = {count} parts")
+
+    def render_cold():
+        zpl_templates.render_label.cache_clear()
+        for part_number, description, quantity, fit in labels:
+            zpl_templates.render_label('standard', part_number, description, quantity, False, fit)
+
+    def render_warm():
+        for part_number, description, quantity, fit in labels:
+            zpl_templates.render_label('standard', part_number, description, quantity, False, fit)
+
+    def render_recall():
+        zpl_templates.render_recall.cache_clear()
+        for part_number, description, quantity, _ in labels:
+            zpl_templates.render_recall('standard', part_number, description, quantity)
+
+    def fit_labels():
+        font_metrics.label_fit.cache_clear()
+        for part_number, description, _, _ in labels:
+            font_metrics.label_fit(part_number, description)
+
+    def collapse():
+        zpl_templates.collapse_labels((part_number, description, quantity)
+                                      for part_number, description, quantity, _ in labels)
+
+    report("render_label (cold cache)", best_of(args.repeat, 1, render_cold), count)
+    report("render_label (warm cache)", best_of(args.repeat, 1, render_warm), count)
+    report("render_recall (cold cache)", best_of(args.repeat, 1, render_recall), count)
+    report("font_metrics.label_fit (cold cache)", best_of(args.repeat, 1, fit_labels), count)
+    report("collapse_labels", best_of(args.repeat, 1, collapse), count)
+
+    directory = tempfile.mkdtemp(prefix='zpl-bench-')
+    try:
+        json_path = os.path.join(directory, 'label_data.json')
+        catalog.save_label_data(label_data, json_path)
+
+        def json_load_cold():
+            catalog.invalidate_cache(json_path)
+            catalog.load_label_data(json_path)
+
+        report("json load (cold)", best_of(args.repeat, 1, json_load_cold))
+        report("json load (cached)", best_of(args.repeat, 1000, lambda: catalog.load_label_data(json_path)))
+        report("json save_label_data (full rewrite)",
+               best_of(args.repeat, 1, lambda: catalog.save_label_data(label_data, json_path)))
+        part = kit_batch.part_entry('BENCH-1', 'benchmark part')
+        report("json store_part (journal append)",
+               best_of(args.repeat, 20, lambda: catalog.store_part(json_path, 'KIT-00000', 'BENCH-1', part)))
+
+        db_path = os.path.join(directory, 'label_data.db')
+        sqlite_storage = storage.SqliteStorage(db_path)
+        report("sqlite replace_all", best_of(args.repeat, 1, lambda: sqlite_storage.replace_all(label_data)))
+
+        def sqlite_load_cold():
+            sqlite_storage._data = None
+            sqlite_storage.load()
+
+        report("sqlite load (cold)", best_of(args.repeat, 1, sqlite_load_cold))
+        report("sqlite load (cached)", best_of(args.repeat, 1000, sqlite_storage.load))
+        report("sqlite store_part",
+               best_of(args.repeat, 20, lambda: sqlite_storage.store_part('KIT-00000', 'BENCH-1', part)))
+    finally:
+        shutil.rmtree(directory)
+
+    index = catalog_search.SearchIndex()
+    report("search index build", best_of(1, 1, lambda: index.rebuild(label_data)), count)
+    for query in ('KIT-00042', 'hinge', 'stainles', 'hex bolt m6'):
+        report(f"search {query!r}", best_of(args.repeat, 100, lambda: index.search(query)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+import argparse
+import codecs
+import csv
+import json
+import sys
+
+import catalog
+import label_core
+import printer_transport
+import zpl_templates
+
+# Streaming bulk printing of job files (CSV or JSONL rows of kit_number,
+# part_number, quantity and optionally description). Rows are parsed, rendered
+# and sent chunk by chunk, so memory stays flat however large the file is.
+# After every chunk the printer has accepted, progress reports the row offset
+# to resume from if a later chunk fails.
+#
+#   python bulk_print.py jobs.csv --printer 10.0.0.21 [--offset 1200]
+#   python bulk_print.py jobs.csv --printer "Zebra ZD420" --usb
+
+chunk_labels = 200  # rows rendered and sent per chunk
+
+
+class BulkPrintError(Exception):
+    def __init__(self, message, resume_offset):
+        super().__init__(message)
+        self.resume_offset = resume_offset
+
+
+def iter_rows(lines, file_format):
+    # lines: iterable of text lines, e.g. an open file
+    if file_format == 'csv':
+        yield from csv.DictReader(lines)
+    elif file_format == 'jsonl':
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise ValueError(f"Unknown job file format: {file_format}")
+
+
+def iter_labels(rows, label_data, offset=0):
+    # Yields (row_number, part_number, description, quantity), skipping rows
+    # before offset. A row without a description takes it from the catalog.
+    for row_number, row in enumerate(rows):
+        if row_number < offset:
+            continue
+        if not isinstance(row, dict):
+            raise BulkPrintError(f"Row {row_number}: expected an object.", row_number)
+        part_number = row.get('part_number')
+        if not isinstance(part_number, str) or not part_number.strip():
+            raise BulkPrintError(f"Row {row_number}: part_number is required.", row_number)
+        description = row.get('description')
+        if not description:
+            kit_number = row.get('kit_number')
+            parts = label_data.get(kit_number) if isinstance(kit_number, str) else None
+            part_data = (parts or {}).get(part_number)
+            if part_data is None:
+                raise BulkPrintError(f"Row {row_number}: part {part_number} not found in kit {kit_number}.",
+                                     row_number)
+            description = part_data['description']
+        elif not isinstance(description, str):
+            raise BulkPrintError(f"Row {row_number}: description must be a string.", row_number)
+        quantity = row.get('quantity')
+        try:
+            quantity = 1 if quantity is None or quantity == '' else int(quantity)
+        except (TypeError, ValueError):
+            raise BulkPrintError(f"Row {row_number}: invalid quantity {row.get('quantity')!r}.", row_number)
+        if quantity < 1:
+            raise BulkPrintError(f"Row {row_number}: quantity must be at least 1.", row_number)
+        yield row_number, part_number, description, quantity
+
+
+def iter_chunks(labels, render, size=None):
+    # Yields (first_row, next_row, label_count, zpl_code) per chunk of rows.
+    # render(part_number, description, quantity, serial) returns label bytes.
+    # When a row turns out to be invalid, the good rows before it are still
+    # yielded before the error propagates, so the error's row is exactly
+    # where a resumed job picks up.
+    size = size or chunk_labels
+    chunk = []
+    try:
+        for label in labels:
+            chunk.append(label)
+            if len(chunk) >= size:
+                yield _render_chunk(chunk, render)
+                chunk = []
+    except (BulkPrintError, ValueError, KeyError, csv.Error):
+        if chunk:
+            yield _render_chunk(chunk, render)
+        raise
+    if chunk:
+        yield _render_chunk(chunk, render)
+
+
+def _render_chunk(chunk, render):
+    batch = zpl_templates.collapse_labels((part_number, description, quantity)
+                                          for _, part_number, description, quantity in chunk)
+    zpl_code = b"".join([render(part_number, description, quantity, serial)
+                         for part_number, description, quantity, serial in batch])
+    return chunk[0][0], chunk[-1][0] + 1, sum(quantity for _, _, _, quantity in chunk), zpl_code
+
+
+def bulk_print(lines, file_format, label_data, render, send, offset=0):
+    # Generator yielding a progress dict after every chunk sent.
+    # send(zpl_code, label_count) prints one chunk and raises on failure. On
+    # failure raises BulkPrintError carrying the offset to resume from.
+    rows_done = offset
+    labels_sent = 0
+    try:
+        chunks = iter_chunks(iter_labels(iter_rows(lines, file_format), label_data, offset), render)
+        for first_row, next_row, label_count, zpl_code in chunks:
+            try:
+                send(zpl_code, label_count)
+            except Exception as e:
+                raise BulkPrintError(f"Failed to print rows {first_row}-{next_row - 1}: {e}", first_row)
+            rows_done = next_row
+            labels_sent += label_count
+            yield {'offset': rows_done, 'labels_sent': labels_sent}
+    except BulkPrintError:
+        raise
+    except (ValueError, KeyError, csv.Error) as e:
+        raise BulkPrintError(f"Invalid job file after row {rows_done}: {e}", rows_done)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a CSV/JSONL job file to a Zebra printer.")
+    parser.add_argument('job_file')
+    parser.add_argument('--printer', required=True,
+                        help="printer IP address (raw port 9100), or Windows printer name with --usb")
+    parser.add_argument('--port', type=int, default=printer_transport.default_port)
+    parser.add_argument('--usb', action='store_true', help="send to a local Windows printer queue")
+    parser.add_argument('--confirm', action='store_true',
+                        help="wait for each chunk to print, pausing while the printer reports an error")
+    parser.add_argument('--format', choices=['csv', 'jsonl'],
+                        help="job file format (default: from the file extension)")
+    parser.add_argument('--offset', type=int, default=0, help="row to resume from")
+    parser.add_argument('--catalog', default='label_data.json', help="label data used for missing descriptions")
+    parser.add_argument('--layout', default='standard', choices=sorted(zpl_templates.layouts))
+    args = parser.parse_args(argv)
+
+    file_format = args.format or ('jsonl' if args.job_file.endswith(('.jsonl', '.ndjson')) else 'csv')
+    label_data = catalog.load_label_data(args.catalog)
+    printer = label_core.direct_printer(args.printer, args.usb, args.port, args.confirm)
+
+    def render(part_number, description, quantity, serial):
+        return label_core.generate_zpl(args.layout, part_number, description, quantity=quantity, serial=serial)
+
+    def report(labels_printed, errors):
+        if errors:
+            print(f"Printer paused ({', '.join(errors)}) after {labels_printed} labels of this chunk; "
+                  f"waiting for it to be cleared", file=sys.stderr)
+
+    def send(zpl_code, label_count):
+        label_core.send(printer, zpl_code, args.layout, report)
+
+    with open(args.job_file, 'rb') as file:
+        lines = codecs.iterdecode(file, 'utf-8-sig')
+        try:
+            for progress in bulk_print(lines, file_format, label_data, render, send, args.offset):
+                print(f"rows done: {progress['offset']}, labels sent: {progress['labels_sent']}", file=sys.stderr)
+        except BulkPrintError as e:
+            print(f"{e}\nResume with --offset {e.resume_offset}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
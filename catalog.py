@@ -0,0 +1,389 @@
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Label data lives in a JSON snapshot (label_data.json) plus an append-only
+# journal next to it (label_data.json.journal). Every store/delete/move (and
+# every batch of whole-kit replacements) is
+# appended to the journal as one small JSON line instead of rewriting the
+# whole snapshot; loading replays the journal on top of the snapshot. Once the
+# journal grows past journal_compact_bytes it is folded back into the snapshot
+# by a background thread.
+#
+# Journal records only ever *set* state (a part's data, a kit's order), so
+# replaying a record that is already part of the snapshot is harmless. That
+# lets compaction replace the snapshot first and trim the journal second
+# without a crash in between losing or corrupting anything.
+#
+# Writers in different processes (e.g. several gunicorn workers) are
+# serialized by an OS file lock on label_data.json.lock, so a read-modify-write
+# such as a move always starts from the latest journal, and compaction cannot
+# trim away a record another process is appending.
+
+journal_compact_bytes = 1024 * 1024
+
+# Process-wide cache of loaded label data, keyed by snapshot path. Each entry
+# remembers the snapshot (mtime, size) stamp and how far into the journal it
+# has replayed, so files are only re-read when they actually change on disk.
+_cache = {}
+_cache_lock = threading.RLock()
+_compacting = set()
+
+cache_stats = {'hits': 0, 'misses': 0, 'replays': 0, 'compactions': 0}
+
+
+def journal_path(path):
+    return path + '.journal'
+
+
+def _file_stat(path):
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+def _snapshot_stamp(stat):
+    if stat is None:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _journal_id(stat):
+    if stat is None:
+        return None
+    return (stat.st_dev, stat.st_ino)
+
+
+def _write_temp(path, data):
+    # Temp file in the same directory as path, so it can be renamed over it
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
+def write_atomic(path, data):
+    # Readers only ever see the old or the new file, never a torn one
+    tmp_path = _write_temp(path, data)
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+@contextlib.contextmanager
+def _writer_lock(path):
+    # Exclusive across processes; take it before _cache_lock, never inside it
+    with open(path + '.lock', 'a+b') as file:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _apply_record(label_data, record):
+    op = record.get('op')
+    kit_number = record.get('kit')
+    if op == 'store':
+        label_data.setdefault(kit_number, {})[record['part']] = record['data']
+    elif op == 'delete':
+        parts = label_data.get(kit_number)
+        if parts is not None and record['part'] in parts:
+            del parts[record['part']]
+            if not parts:
+                del label_data[kit_number]
+    elif op == 'order':
+        parts = label_data.get(kit_number)
+        if parts is not None:
+            ordered = {part: parts[part] for part in record['parts'] if part in parts}
+            for part, part_data in parts.items():
+                ordered.setdefault(part, part_data)
+            label_data[kit_number] = ordered
+    elif op == 'kits':
+        # Whole kits in their new order; null removes the kit
+        for kit_number, parts in record['kits'].items():
+            if parts:
+                label_data[kit_number] = dict(parts)
+            else:
+                label_data.pop(kit_number, None)
+
+
+def _read_journal(path, offset):
+    # Returns the records on every complete journal line from offset onwards
+    # and the offset just past the last complete line. A trailing partial line
+    # (a crash mid-append) is left out; the next writer cuts it off.
+    try:
+        with open(journal_path(path), 'rb') as file:
+            file.seek(offset)
+            chunk = file.read()
+    except FileNotFoundError:
+        return [], offset
+
+    end = chunk.rfind(b'\n') + 1
+    records = []
+    for line in chunk[:end].splitlines():
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records, offset + end
+
+
+def _copy_for(label_data, records):
+    # Copy-on-write: the cached dict may be iterated by other threads at any
+    # time, so changes go into a new top-level dict with fresh copies of the
+    # kits they touch (the others are shared, and never modified in place)
+    label_data = dict(label_data)
+    for record in records:
+        kit_number = record.get('kit')
+        if kit_number in label_data:
+            label_data[kit_number] = dict(label_data[kit_number])
+    return label_data
+
+
+def load_label_data(path):
+    # The returned dict is shared by every caller in this process and must be
+    # treated as read-only; change it through store_part/delete_part/move_part.
+    # Those never modify it either: they cache a changed copy, so a caller
+    # can iterate what it got while other threads write.
+    snapshot_stat = _file_stat(path)
+    journal_stat = _file_stat(journal_path(path))
+    snapshot_stamp = _snapshot_stamp(snapshot_stat)
+    journal_id = _journal_id(journal_stat)
+    journal_size = journal_stat.st_size if journal_stat is not None else 0
+
+    with _cache_lock:
+        entry = _cache.get(path)
+        if (entry is not None and entry['snapshot'] == snapshot_stamp
+                and entry['journal_id'] == journal_id
+                and entry['journal_offset'] <= journal_size):
+            records, offset = (_read_journal(path, entry['journal_offset'])
+                               if entry['journal_offset'] < journal_size else ([], entry['journal_offset']))
+            if records:
+                # Another process appended to the journal; only replay the tail.
+                # The tail is applied to a copy, so callers holding the old dict
+                # (e.g. a search index built from it) can tell it changed.
+                cache_stats['replays'] += 1
+                label_data = _copy_for(entry['data'], records)
+                for record in records:
+                    _apply_record(label_data, record)
+                entry['data'] = label_data
+            else:
+                cache_stats['hits'] += 1
+            entry['journal_offset'] = offset
+            return entry['data']
+
+        cache_stats['misses'] += 1
+        if snapshot_stat is None:
+            label_data = {}
+        else:
+            with open(path, 'r') as file:
+                label_data = json.load(file)
+        offset = 0
+        if journal_stat is not None:
+            records, offset = _read_journal(path, 0)
+            for record in records:
+                _apply_record(label_data, record)
+        _cache[path] = {
+            'snapshot': snapshot_stamp,
+            'journal_id': journal_id,
+            'journal_offset': offset,
+            'data': label_data,
+        }
+        return label_data
+
+
+def _write_record(path, label_data, record):
+    # Appends record to the journal and caches label_data (the dict returned
+    # by load_label_data under this same lock) with the record applied.
+    # Called with the writer lock held, right after load_label_data, so the
+    # cached offset is the end of the journal's last complete line. Anything
+    # past it is a partial line from a crash mid-append (no other writer can
+    # be appending); it is cut off so the record starts on a line of its own.
+    line = (json.dumps(record) + '\n').encode()
+    entry = _cache[path]
+    with open(journal_path(path), 'ab') as file:
+        if os.fstat(file.fileno()).st_size > entry['journal_offset']:
+            file.truncate(entry['journal_offset'])
+        file.write(line)
+        file.flush()
+        os.fsync(file.fileno())
+        journal_stat = os.fstat(file.fileno())
+
+    label_data = _copy_for(label_data, [record])
+    _apply_record(label_data, record)
+    entry['data'] = label_data
+    entry['journal_id'] = _journal_id(journal_stat)
+    entry['journal_offset'] = journal_stat.st_size
+    if journal_stat.st_size >= journal_compact_bytes:
+        _schedule_compaction(path)
+
+
+def store_part(path, kit_number, part_number, part_data):
+    record = {'op': 'store', 'kit': kit_number, 'part': part_number, 'data': part_data}
+    with _writer_lock(path), _cache_lock:
+        _write_record(path, load_label_data(path), record)
+
+
+def delete_part(path, kit_number, part_number):
+    with _writer_lock(path), _cache_lock:
+        label_data = load_label_data(path)
+        if kit_number not in label_data or part_number not in label_data[kit_number]:
+            return False
+        _write_record(path, label_data, {'op': 'delete', 'kit': kit_number, 'part': part_number})
+        return True
+
+
+def move_part(path, kit_number, part_number, direction):
+    with _writer_lock(path), _cache_lock:
+        label_data = load_label_data(path)
+        if kit_number not in label_data or part_number not in label_data[kit_number]:
+            return False
+        parts = list(label_data[kit_number])
+        index = parts.index(part_number)
+        if direction == 'up' and index > 0:
+            parts[index], parts[index - 1] = parts[index - 1], parts[index]
+        elif direction == 'down' and index < len(parts) - 1:
+            parts[index], parts[index + 1] = parts[index + 1], parts[index]
+        else:
+            return True
+        _write_record(path, label_data, {'op': 'order', 'kit': kit_number, 'parts': parts})
+        return True
+
+
+def replace_kits(path, kits):
+    # kits: {kit_number: {part_number: part_data} in print order, or None to
+    # delete the kit}, written as a single journal record
+    with _writer_lock(path), _cache_lock:
+        _write_record(path, load_label_data(path), {'op': 'kits', 'kits': kits})
+
+
+def update_kit(path, kit_number, update):
+    # Read-modify-write of one kit under the writer lock: update(parts) gets
+    # the kit's current {part_number: part_data} ({} for a new kit) and
+    # returns its new contents (empty deletes the kit). Nothing is written if
+    # update raises. Returns the new contents.
+    with _writer_lock(path), _cache_lock:
+        label_data = load_label_data(path)
+        parts = update(label_data.get(kit_number) or {})
+        _write_record(path, label_data, {'op': 'kits', 'kits': {kit_number: parts or None}})
+        return parts
+
+
+def save_label_data(label_data, path):
+    # Replaces the whole catalog: write a fresh snapshot and drop the journal
+    with _writer_lock(path), _cache_lock:
+        write_atomic(path, json.dumps(label_data).encode())
+        try:
+            os.remove(journal_path(path))
+        except FileNotFoundError:
+            pass
+        _cache[path] = {
+            'snapshot': _snapshot_stamp(_file_stat(path)),
+            'journal_id': None,
+            'journal_offset': 0,
+            'data': label_data,
+        }
+
+
+def compact(path):
+    # Serialize under the lock so the snapshot matches a known journal offset,
+    # but do the slow file write outside it so readers are not held up.
+    with _cache_lock:
+        data = json.dumps(load_label_data(path)).encode()
+        entry = _cache[path]
+        snapshot_stamp = entry['snapshot']
+        journal_id = entry['journal_id']
+        offset = entry['journal_offset']
+
+    tmp_path = _write_temp(path, data)
+    try:
+        with _writer_lock(path), _cache_lock:
+            entry = _cache.get(path)
+            if (entry is None or entry['snapshot'] != snapshot_stamp or entry['journal_id'] != journal_id
+                    or _snapshot_stamp(_file_stat(path)) != snapshot_stamp
+                    or _journal_id(_file_stat(journal_path(path))) != journal_id):
+                # The files were replaced underneath us (save_label_data or
+                # another process compacting); this snapshot is stale
+                return
+            os.replace(tmp_path, path)
+            # Keep only the records appended after the snapshot was taken
+            try:
+                with open(journal_path(path), 'rb') as file:
+                    file.seek(offset)
+                    tail = file.read()
+            except FileNotFoundError:
+                tail = b''
+            if tail:
+                write_atomic(journal_path(path), tail)
+            else:
+                try:
+                    os.remove(journal_path(path))
+                except FileNotFoundError:
+                    pass
+
+            entry['snapshot'] = _snapshot_stamp(_file_stat(path))
+            entry['journal_id'] = _journal_id(_file_stat(journal_path(path)))
+            entry['journal_offset'] = entry['journal_offset'] - offset
+            cache_stats['compactions'] += 1
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _schedule_compaction(path):
+    with _cache_lock:
+        if path in _compacting:
+            return
+        _compacting.add(path)
+
+    def run():
+        try:
+            compact(path)
+        finally:
+            with _cache_lock:
+                _compacting.discard(path)
+
+    threading.Thread(target=run, name='catalog-compaction', daemon=True).start()
+
+
+def invalidate_cache(path=None):
+    with _cache_lock:
+        if path is None:
+            _cache.clear()
+        else:
+            _cache.pop(path, None)
@@ -0,0 +1,338 @@
+import collections
+import heapq
+import itertools
+import re
+import threading
+
+# In-memory search over kit_number, part_number and description. Every
+# indexed token (whole part and kit numbers plus their alphanumeric pieces and
+# description words, lowercased) goes into a prefix trie and a trigram index.
+# A query term matches tokens it is a prefix of; a term with no prefix match
+# falls back to tokens sharing enough trigrams (typos, missing characters).
+# Multi-term queries return parts matching every term.
+#
+# The index follows the catalog through sync(): only kits whose contents
+# changed are re-indexed, so it is built from the full catalog once per
+# process. Full builds happen aside and are swapped in, so searches never
+# wait on one except the very first.
+
+max_expansions = 200   # tokens a query term expands to when choosing the term to search by
+fuzzy_threshold = 0.3  # minimum trigram similarity for a fuzzy match
+fuzzy_candidates = 5000  # trigram postings read to find fuzzy candidates, rarest trigrams first
+max_scored = 200       # multi-term hits ranked before truncating, at least
+rebuild_fraction = 0.25  # sync rebuilds instead of re-indexing when more kits changed
+
+_words = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    text = text.lower()
+    tokens = set(_words.findall(text))
+    tokens.update(text.split())
+    return tokens
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._trie = {}
+        self._token_parts = {}  # token -> {(kit_number, part_number), ...}
+        self._trigrams = collections.defaultdict(set)  # trigram -> {token, ...}
+        self._parts = {}  # (kit_number, part_number) -> (description, tokens, " token token ...")
+        self._kits = {}  # kit_number -> {part_number, ...}
+        self.source = None
+
+    def rebuild(self, label_data):
+        # Indexes label_data into a fresh index, then swaps it in; searches
+        # keep using the old contents meanwhile
+        fresh = SearchIndex()
+        for kit_number, parts in label_data.items():
+            for part_number, part_data in parts.items():
+                fresh.add(kit_number, part_number, part_data.get('description', ''))
+        with self._lock:
+            for name in ('_trie', '_token_parts', '_trigrams', '_parts', '_kits'):
+                setattr(self, name, getattr(fresh, name))
+            self.source = label_data
+
+    def sync(self, label_data):
+        # Brings the index up to date with label_data (the catalog's current
+        # load()). source is the dict last synced to; kits that are not the
+        # same dict and not equal to it either are re-indexed.
+        if self.source is label_data:
+            return self
+        with self._sync_lock:
+            source = self.source
+            if source is label_data:
+                return self
+            if source is None:
+                self.rebuild(label_data)
+                return self
+            changed = [kit_number for kit_number, parts in label_data.items()
+                       if source.get(kit_number) is not parts and source.get(kit_number) != parts]
+            changed.extend(kit_number for kit_number in source if kit_number not in label_data)
+            if len(changed) > rebuild_fraction * max(len(label_data), 1):
+                self.rebuild(label_data)
+                return self
+            with self._lock:
+                for kit_number in changed:
+                    self.replace_kit(kit_number, label_data.get(kit_number))
+                self.source = label_data
+        return self
+
+    def add(self, kit_number, part_number, description):
+        key = (kit_number, part_number)
+        tokens = tokenize(kit_number) | tokenize(part_number) | tokenize(description)
+        with self._lock:
+            if key in self._parts:
+                self.remove(kit_number, part_number)
+            self._parts[key] = (description, tokens, ' ' + ' '.join(tokens))
+            self._kits.setdefault(kit_number, set()).add(part_number)
+            for token in tokens:
+                parts = self._token_parts.get(token)
+                if parts is None:
+                    parts = self._token_parts[token] = set()
+                    self._add_token(token)
+                parts.add(key)
+
+    def remove(self, kit_number, part_number):
+        key = (kit_number, part_number)
+        with self._lock:
+            entry = self._parts.pop(key, None)
+            if entry is None:
+                return
+            kit_parts = self._kits[kit_number]
+            kit_parts.discard(part_number)
+            if not kit_parts:
+                del self._kits[kit_number]
+            for token in entry[1]:
+                parts = self._token_parts[token]
+                parts.discard(key)
+                if not parts:
+                    del self._token_parts[token]
+                    self._remove_token(token)
+
+    def replace_kit(self, kit_number, parts):
+        # parts: the kit's new {part_number: part_data}, or None if deleted
+        with self._lock:
+            for part_number in list(self._kits.get(kit_number, ())):
+                self.remove(kit_number, part_number)
+            for part_number, part_data in (parts or {}).items():
+                self.add(kit_number, part_number, part_data.get('description', ''))
+
+    def _add_token(self, token):
+        node = self._trie
+        for char in token:
+            node = node.setdefault(char, {})
+        node[''] = True
+        for trigram in trigrams(token):
+            self._trigrams[trigram].add(token)
+
+    def _remove_token(self, token):
+        path = [self._trie]
+        for char in token:
+            path.append(path[-1][char])
+        del path[-1]['']
+        # Prune nodes left without tokens below them
+        for depth in range(len(token), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][token[depth - 1]]
+        for trigram in trigrams(token):
+            tokens = self._trigrams[trigram]
+            tokens.discard(token)
+            if not tokens:
+                del self._trigrams[trigram]
+
+    def _prefix_tokens(self, prefix):
+        # Every token starting with prefix, prefix itself first. A generator
+        # walking the trie depth first, so callers that stop early never
+        # visit the whole subtree under a short prefix.
+        node = self._trie
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return
+        if '' in node:
+            yield prefix
+        stack = [(prefix + char, child) for char, child in node.items() if char != '']
+        while stack:
+            text, node = stack.pop()
+            for char, child in node.items():
+                if char == '':
+                    yield text
+                else:
+                    stack.append((text + char, child))
+
+    def _fuzzy_tokens(self, term):
+        # {token: similarity} for tokens sharing enough trigrams with term.
+        # Candidates come from the term's rarest trigrams, up to
+        # fuzzy_candidates postings: one like "000" is in most part numbers
+        # and would make every token a candidate.
+        query = trigrams(term)
+        counts = collections.Counter()
+        read = 0
+        for tokens in sorted((self._trigrams.get(trigram, ()) for trigram in query), key=len):
+            if read and read + len(tokens) > fuzzy_candidates:
+                break
+            counts.update(tokens)
+            read += len(tokens)
+        # The most shared trigrams first, ties by token so results are stable
+        best = list(counts)
+        wanted = max_expansions * 2
+        if len(best) > wanted:
+            floor = heapq.nlargest(wanted, counts.values())[-1]
+            best = [token for token, count in counts.items() if count > floor]
+            best.extend(sorted(token for token, count in counts.items() if count == floor)[:wanted - len(best)])
+        matches = {}
+        for token in best:
+            common = len(query & trigrams(token))
+            similarity = common / (len(query) + len(trigrams(token)) - common)
+            if similarity >= fuzzy_threshold:
+                matches[token] = similarity
+        return matches
+
+    def _term_matcher(self, term):
+        # Returns (tokens, weight_of, postings, similarity) for a query term,
+        # or None if nothing matches it. tokens iterates every matching token,
+        # best first; weight_of(part) is the term's best weight among the
+        # tokens of a _parts entry (exact 3, prefix 2, fuzzy < 1), or None;
+        # postings is how many parts the tokens point at, None if the term
+        # expands to more than max_expansions tokens and was not counted;
+        # similarity is {token: weight} if the term fell back to fuzzy
+        # matches, else None.
+        expansion = self._prefix_tokens(term)
+        first = list(itertools.islice(expansion, max_expansions + 1))
+        if len(first) > max_expansions:
+            spaced = ' ' + term
+
+            def weight_of(part):
+                if term in part[1]:
+                    return 3
+                return 2 if spaced in part[2] else None
+            return itertools.chain(first, expansion), weight_of, None, None
+
+        if first:
+            prefixed = set(first)
+
+            def weight_of(part):
+                if term in part[1]:
+                    return 3
+                return 2 if not prefixed.isdisjoint(part[1]) else None
+            postings = sum(len(self._token_parts[token]) for token in first)
+            return first, weight_of, postings, None
+
+        weights = self._fuzzy_tokens(term)
+        if not weights:
+            return None
+
+        def weight_of(part):
+            found = weights.keys() & part[1]
+            return max(map(weights.get, found)) if found else None
+        postings = sum(len(self._token_parts[token]) for token in weights)
+        return sorted(weights, key=weights.get, reverse=True), weight_of, postings, weights
+
+    def _term_parts(self, tokens):
+        # Every part any of tokens points at; the index's own set for one token
+        if len(tokens) == 1:
+            return self._token_parts[tokens[0]]
+        return set().union(*(self._token_parts[token] for token in tokens))
+
+    def _rank(self, terms, matchers, candidates, limit):
+        # Ranks candidates that match every term, best first. A part scores
+        # its best weight per term. A prefix term only tells parts with its
+        # exact token (3) from the rest (2), and a fuzzy term's tokens are
+        # walked best first, each part scoring the first one it has, so the
+        # scores come from posting set operations instead of from every
+        # part's tokens. bonus is each part's score above the lowest.
+        bonus = collections.Counter()
+        for term, (tokens, _, _, similarity) in zip(terms, matchers):
+            if similarity is None:
+                exact = self._token_parts.get(term)
+                if exact is not None and not candidates <= exact:
+                    bonus.update(candidates & exact)
+                continue
+            left = candidates
+            for token in tokens:
+                found = left & self._token_parts[token]
+                if found:
+                    weight = similarity[token]
+                    for key in found:
+                        bonus[key] += weight
+                    left = left - found
+                    if not left:
+                        break
+        ranked = heapq.nsmallest(limit, bonus, key=lambda key: (-bonus[key], key))
+        if len(ranked) < limit:
+            ranked.extend(heapq.nsmallest(limit - len(ranked), candidates.difference(bonus)))
+        return ranked
+
+    def search(self, query, limit=20):
+        # Returns [(kit_number, part_number, description), ...] best first
+        terms = sorted(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            matchers = [self._term_matcher(term) for term in terms]
+            if not all(matchers):
+                return []
+
+            # Terms with countable expansions are intersected on their full
+            # posting sets, fewest postings first. The postings of the first
+            # one (or, if none is countable, the longest term) are then walked
+            # best token first, keeping parts in the intersection whose tokens
+            # also match the uncounted terms. The whole expansion is walked if
+            # need be, so no matching part is missed.
+            order = sorted(range(len(terms)), key=lambda index: (
+                matchers[index][2] is None, matchers[index][2] or 0, -len(terms[index])))
+            tokens = matchers[order[0]][0]
+            candidates = None
+            uncounted = []
+            if len(terms) > 1:
+                for index in order:
+                    term_tokens, term_weight_of, postings, _ = matchers[index]
+                    if postings is None:
+                        uncounted.append(term_weight_of)
+                    elif candidates is not None and len(candidates) * 16 < postings:
+                        # Checking a few candidates' tokens beats building
+                        # the union of many postings
+                        candidates = {key for key in candidates
+                                      if term_weight_of(self._parts[key]) is not None}
+                    else:
+                        parts = self._term_parts(term_tokens)
+                        candidates = parts if candidates is None else candidates & parts
+                    if candidates is not None and not candidates:
+                        return []
+            term_weights = [matcher[1] for matcher in matchers]
+            wanted = limit if len(terms) == 1 else max(limit, max_scored)
+
+            def score(key):
+                part = self._parts[key]
+                weights = [term_weight_of(part) for term_weight_of in term_weights]
+                return None if None in weights else sum(weights)
+
+            hits = {}
+            if candidates is not None and not uncounted:
+                # Every candidate matches; rank them all
+                ranked = self._rank(terms, matchers, candidates, limit)
+            else:
+                for token in tokens:
+                    for key in self._token_parts[token]:
+                        if key in hits or (candidates is not None and key not in candidates):
+                            continue
+                        weight = score(key)
+                        if weight is None:
+                            continue
+                        hits[key] = weight
+                        if len(hits) >= wanted:
+                            break
+                    if len(hits) >= wanted:
+                        break
+                ranked = sorted(hits, key=lambda key: (-hits[key], key))[:limit]
+            return [(kit_number, part_number, self._parts[(kit_number, part_number)][0])
+                    for kit_number, part_number in ranked]
@@ -0,0 +1,106 @@
+import functools
+
+# Text metrics for Zebra scalable font 0 (CG Triumvirate Bold Condensed), used
+# to center and wrap label text instead of assuming every character is as
+# wide as the font. Advance widths are approximations in 1/1000 of the ^A0
+# width parameter; characters outside the table use default_advance.
+
+label_width = 609        # dots
+part_number_margin = 20  # minimum space left and right of the part number
+part_number_font = (74, 76)  # preferred ^A0 height and width
+part_number_min_height = 30
+description_block_width = 550
+description_max_lines = 5
+description_font_height = 28
+description_min_font_height = 18
+
+default_advance = 560
+
+_advances = {
+    ' ': 228, '!': 273, '"': 389, '#': 456, '$': 456, '%': 729, '&': 592, "'": 195,
+    '(': 273, ')': 273, '*': 319, '+': 479, ',': 228, '-': 273, '.': 228, '/': 228,
+    '0': 456, '1': 456, '2': 456, '3': 456, '4': 456, '5': 456, '6': 456, '7': 456,
+    '8': 456, '9': 456, ':': 273, ';': 273, '<': 479, '=': 479, '>': 479, '?': 501,
+    '@': 800, 'A': 592, 'B': 592, 'C': 592, 'D': 592, 'E': 547, 'F': 501, 'G': 638,
+    'H': 592, 'I': 228, 'J': 456, 'K': 592, 'L': 501, 'M': 683, 'N': 592, 'O': 638,
+    'P': 547, 'Q': 638, 'R': 592, 'S': 547, 'T': 501, 'U': 592, 'V': 547, 'W': 774,
+    'X': 547, 'Y': 547, 'Z': 501, '[': 273, '\\': 228, ']': 273, '^': 479, '_': 456,
+    '`': 273, 'a': 456, 'b': 501, 'c': 456, 'd': 501, 'e': 456, 'f': 273, 'g': 501,
+    'h': 501, 'i': 228, 'j': 228, 'k': 456, 'l': 228, 'm': 729, 'n': 501, 'o': 501,
+    'p': 501, 'q': 501, 'r': 319, 's': 456, 't': 273, 'u': 501, 'v': 456, 'w': 638,
+    'x': 456, 'y': 456, 'z': 410, '{': 319, '|': 230, '}': 319, '~': 479,
+}
+
+# Lookup table indexed by code point for the first 256 characters
+_advance_table = [_advances.get(chr(code), default_advance) for code in range(256)]
+
+
+def text_units(text):
+    # Width of text in 1/1000 of the font width
+    table = _advance_table
+    return sum([table[code] if code < 256 else default_advance for code in map(ord, text)])
+
+
+def text_width(text, font_width):
+    return text_units(text) * font_width // 1000
+
+
+def text_widths(texts, font_width):
+    # Widths of a batch of strings at one font width
+    table = _advance_table
+    return [sum([table[code] if code < 256 else default_advance for code in map(ord, text)]) * font_width // 1000
+            for text in texts]
+
+
+def char_advances(text, font_width):
+    # Per-character advances in dots, for drawing text
+    return [(_advance_table[code] if code < 256 else default_advance) * font_width / 1000
+            for code in map(ord, text)]
+
+
+def wrap_lines(text, block_width, font_width):
+    # Greedy word wrap the way ^FB breaks lines
+    space = _advance_table[32] * font_width // 1000
+    lines = []
+    line = ''
+    line_width = 0
+    for word, word_width in zip(text.split(), text_widths(text.split(), font_width)):
+        if line and line_width + space + word_width > block_width:
+            lines.append(line)
+            line, line_width = word, word_width
+        elif line:
+            line, line_width = f"{line} {word}", line_width + space + word_width
+        else:
+            line, line_width = word, word_width
+    lines.append(line)
+    return lines
+
+
+def fit_part_number(part_number):
+    # Largest font (down to part_number_min_height) that fits the label width,
+    # and the x position that centers it. Returns (x, height, width).
+    height, width = part_number_font
+    max_width = label_width - 2 * part_number_margin
+    units = text_units(part_number)
+    while height > part_number_min_height and units * width // 1000 > max_width:
+        height -= 2
+        width = height * part_number_font[1] // part_number_font[0]
+    return max(0, (label_width - units * width // 1000) // 2), height, width
+
+
+def fit_description(description):
+    # Largest font (down to description_min_font_height) whose wrapped lines
+    # fit the ^FB block. Returns (font height, line count).
+    height = description_font_height
+    lines = len(wrap_lines(description, description_block_width, height))
+    while height > description_min_font_height and lines > description_max_lines:
+        height -= 2
+        lines = len(wrap_lines(description, description_block_width, height))
+    return height, max(1, min(lines, description_max_lines))
+
+
+@functools.lru_cache(maxsize=8192)
+def label_fit(part_number, description):
+    # Everything the layouts need to place a part's text, computed once per
+    # part: (part_x, part_height, part_width, description_height, description_lines)
+    return fit_part_number(part_number) + fit_description(description)
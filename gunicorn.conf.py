@@ -0,0 +1,26 @@
+import os
+
+# gunicorn settings for wsgi.py, overridable from the environment:
+#
+#   ZPL_PRINT_BIND     address to listen on (default 0.0.0.0:5000)
+#   ZPL_PRINT_THREADS  request threads (default 16)
+#
+# Only a single worker process is supported; it scales with threads. Print
+# queues, job status, the printer monitor and the pooled 9100 connections
+# live in the process, so with several workers a /jobs/<id> poll landing on
+# another worker would get a 404, "least busy" routing would only see one
+# worker's jobs, and every worker would hold its own connection to printers
+# that often serve one at a time. Print requests mostly wait on printers, so
+# threads cover the load. Other processes (bulk_print.py, the desktop app)
+# can still share the catalog: its writes are locked across processes.
+
+wsgi_app = 'wsgi:create_app()'
+bind = os.environ.get('ZPL_PRINT_BIND', '0.0.0.0:5000')
+workers = 1
+threads = int(os.environ.get('ZPL_PRINT_THREADS', '16'))
+worker_class = 'gthread'
+# /print/bulk streams for as long as a job file takes; gthread workers only
+# need to heartbeat, not finish requests, within this timeout
+timeout = 120
+graceful_timeout = 30
+accesslog = '-'
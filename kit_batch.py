@@ -0,0 +1,140 @@
+import csv
+import io
+import json
+
+import bulk_print
+import font_metrics
+
+# Whole-kit edits for the bulk admin endpoints: a batch of adds, deletes and
+# an explicit new part order is validated against the current kit and turned
+# into the kit's new contents, which storage then writes in one go. Kits are
+# exported and imported as CSV/JSONL rows (the same columns as bulk print job
+# files) or as a JSON document {kit_number: [part_data, ...]}.
+
+export_columns = ['kit_number', 'part_number', 'description', 'quantity']
+
+
+class BatchError(ValueError):
+    pass
+
+
+def part_entry(part_number, description, quantity=1):
+    # A part as stored in the catalog, with its label fit measured once
+    return {
+        "part_number": part_number,
+        "description": description,
+        "quantity": quantity,
+        "fit": list(font_metrics.label_fit(part_number, description)),
+    }
+
+
+def _validated_part(row, where):
+    part_number = row.get('part_number')
+    description = row.get('description')
+    if not isinstance(part_number, str) or not part_number.strip():
+        raise BatchError(f"{where}: part_number is required.")
+    if not isinstance(description, str) or not description.strip():
+        raise BatchError(f"{where}: description is required.")
+    try:
+        quantity = int(row.get('quantity') or 1)
+    except (TypeError, ValueError):
+        raise BatchError(f"{where}: invalid quantity {row.get('quantity')!r}.")
+    if quantity < 1:
+        raise BatchError(f"{where}: quantity must be at least 1.")
+    return part_entry(part_number, description, quantity)
+
+
+def apply_batch(parts, add=(), delete=(), order=None):
+    # parts: the kit's current {part_number: part_data} (empty for a new kit).
+    # Deletes apply first, then adds (replacing parts with the same number in
+    # place), then order: the listed parts move to the front in that order and
+    # the rest keep their relative order. Returns the new kit contents.
+    for name, value in (('add', add), ('delete', delete), ('order', order)):
+        if value is not None and not isinstance(value, (list, tuple)):
+            raise BatchError(f"{name}: expected a list.")
+    for name, value in (('delete', delete), ('order', order)):
+        for index, part_number in enumerate(value or ()):
+            if not isinstance(part_number, str):
+                raise BatchError(f"{name}[{index}]: expected a part number string.")
+    parts = dict(parts)
+    for part_number in delete:
+        if part_number not in parts:
+            raise BatchError(f"delete: part {part_number} is not in the kit.")
+        del parts[part_number]
+    for index, row in enumerate(add):
+        if not isinstance(row, dict):
+            raise BatchError(f"add[{index}]: expected an object.")
+        part_data = _validated_part(row, f"add[{index}]")
+        parts[part_data['part_number']] = part_data
+    if order is not None:
+        if len(set(order)) != len(order):
+            raise BatchError("order: part numbers must be unique.")
+        missing = [part_number for part_number in order if part_number not in parts]
+        if missing:
+            raise BatchError(f"order: parts not in the kit: {', '.join(map(str, missing))}.")
+        ordered = {part_number: parts[part_number] for part_number in order}
+        for part_number, part_data in parts.items():
+            ordered.setdefault(part_number, part_data)
+        parts = ordered
+    return parts
+
+
+def export_kits(kits, file_format):
+    # kits: {kit_number: {part_number: part_data}}; returns the file as text
+    if file_format == 'json':
+        return json.dumps({kit_number: list(parts.values()) for kit_number, parts in kits.items()}, indent=2)
+    if file_format == 'jsonl':
+        return ''.join(json.dumps({'kit_number': kit_number, 'part_number': part_data['part_number'],
+                                   'description': part_data['description'],
+                                   'quantity': part_data.get('quantity', 1)}) + '\n'
+                       for kit_number, parts in kits.items() for part_data in parts.values())
+    if file_format == 'csv':
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(export_columns)
+        for kit_number, parts in kits.items():
+            for part_data in parts.values():
+                writer.writerow([kit_number, part_data['part_number'], part_data['description'],
+                                 part_data.get('quantity', 1)])
+        return output.getvalue()
+    raise BatchError(f"Unknown export format: {file_format}")
+
+
+def import_kits(lines, file_format):
+    # lines: iterable of text lines. Returns {kit_number: {part_number: part_data}}
+    # with kits and parts in file order; every kit in the file is meant to
+    # replace the stored kit of the same number.
+    kits = {}
+    if file_format == 'json':
+        try:
+            document = json.loads(''.join(lines))
+        except ValueError as e:
+            raise BatchError(f"Invalid JSON: {e}")
+        if not isinstance(document, dict):
+            raise BatchError("Expected an object of kit_number: [part, ...].")
+        for kit_number, parts in document.items():
+            if not isinstance(parts, list):
+                raise BatchError(f"Kit {kit_number}: expected a list of parts.")
+        rows = ((dict(part, kit_number=kit_number) if isinstance(part, dict) else part)
+                for kit_number, parts in document.items() for part in parts)
+    else:
+        rows = bulk_print.iter_rows(lines, file_format)
+
+    try:
+        for row_number, row in enumerate(rows):
+            where = f"Row {row_number}"
+            if not isinstance(row, dict):
+                raise BatchError(f"{where}: expected an object.")
+            kit_number = row.get('kit_number')
+            if not isinstance(kit_number, str) or not kit_number.strip():
+                raise BatchError(f"{where}: kit_number is required.")
+            part_data = _validated_part(row, where)
+            parts = kits.setdefault(kit_number, {})
+            if part_data['part_number'] in parts:
+                raise BatchError(f"{where}: part {part_data['part_number']} appears twice in kit {kit_number}.")
+            parts[part_data['part_number']] = part_data
+    except BatchError:
+        raise
+    except (csv.Error, ValueError) as e:
+        raise BatchError(f"Invalid {file_format} file: {e}")
+    return kits
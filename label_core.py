@@ -0,0 +1,68 @@
+import printer_fleet
+import printer_transport
+import zpl_templates
+
+# The printing path shared by the web app (app.py), the desktop app
+# (Pro Version.py) and the command line tools (bulk_print.py): turning catalog
+# parts into ZPL and sending it to a printer. Catalog access lives in
+# storage.py and job queueing in print_queue.py; this module only ties
+# rendering to the printer transports.
+#
+# Nothing here imports Flask or tkinter, and win32print is imported only when
+# a USB printer is actually sent to, so the core loads quickly on any
+# platform and can be used from scripts without a display.
+
+
+def part_fit(part_data):
+    # Parts stored before label fits were recorded have no "fit"
+    fit = part_data.get('fit')
+    return tuple(fit) if fit else None
+
+
+def generate_zpl(layout, part_number, description, stored_format=False, quantity=1, serial=False, fit=None):
+    # With stored_format the label is a recall of the layout's downloaded ^DF
+    # format. quantity prints that many copies (^PQ); with serial the part
+    # number counts up by one per copy (^SN). fit is the part's stored label
+    # fit, measured on the fly when missing.
+    if stored_format:
+        return zpl_templates.render_recall(layout, part_number, description, quantity, serial)
+    return zpl_templates.render_label(layout, part_number, description, quantity, serial, fit)
+
+
+def label_batch(parts, copies=1):
+    # parts: part_data dicts in print order. Each part prints its catalog
+    # quantity times copies, and runs of identical or counting labels are
+    # collapsed into single ^PQ/^SN formats. Returns
+    # [(part_number, description, quantity, serial, fit), ...].
+    parts = list(parts)
+    fits = {(part_data['part_number'], part_data['description']): part_fit(part_data) for part_data in parts}
+    batch = zpl_templates.collapse_labels(
+        (part_data['part_number'], part_data['description'], part_data.get('quantity', 1) * copies)
+        for part_data in parts)
+    return [(part_number, description, quantity, serial, fits.get((part_number, description)))
+            for part_number, description, quantity, serial in batch]
+
+
+def render_batch(layout, batch, stored_format=False):
+    return b"".join([generate_zpl(layout, part_number, description, stored_format, quantity, serial, fit)
+                     for part_number, description, quantity, serial, fit in batch])
+
+
+def batch_label_count(batch):
+    return sum(quantity for _, _, quantity, _, _ in batch)
+
+
+def direct_printer(target, usb=False, port=printer_transport.default_port, confirm=False):
+    # A printer outside the fleet registry: an IP address for raw 9100, or
+    # with usb a local Windows printer queue name
+    if usb:
+        return printer_fleet.Printer(target, target, transport='usb')
+    return printer_fleet.Printer(target, target, port=port, confirm=confirm)
+
+
+def send(printer, zpl_code, layout, progress=None):
+    # Sends rendered labels to a printer_fleet.Printer, downloading the
+    # layout's stored format first when the printer uses recalls. Returns the
+    # labels printed when the printer confirms them, else None.
+    stored_format = zpl_templates.stored_formats[layout] if printer.stored_formats else None
+    return printer.send(zpl_code, stored_format, progress)
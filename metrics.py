@@ -0,0 +1,187 @@
+import bisect
+import contextlib
+import json
+import logging
+import math
+import threading
+import time
+
+import catalog
+
+# Minimal in-process metrics in the Prometheus text exposition format:
+# counters and latency histograms keyed by label values, rendered on demand
+# for a /metrics endpoint. Recording is a dict lookup and a few additions
+# under a lock, cheap enough for per-label call sites.
+#
+# Per-job timing records go to the "zpl_print.jobs" logger as one JSON object
+# per line when log_job_timings is set.
+
+default_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+log_job_timings = False
+job_log = logging.getLogger('zpl_print.jobs')
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_label_text(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class CallbackCounter:
+    # A counter kept by another module: collect() returns {label values:
+    # count} and is called on every render
+    def __init__(self, name, documentation, labelnames, collect):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_label_text(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=default_buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [per-bucket counts (not cumulative), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', _number(bound))])} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {count}")
+        return lines
+
+
+stage_seconds = Histogram('zpl_stage_duration_seconds',
+                          "Time spent per pipeline stage call.", ['stage'])
+errors_total = Counter('zpl_errors_total', "Errors raised per pipeline stage, by exception type.",
+                       ['stage', 'type'])
+labels_sent_total = Counter('zpl_labels_sent_total', "Labels in print jobs sent successfully.", ['printer'])
+labels_printed_total = Counter('zpl_labels_printed_total',
+                               "Labels the printer confirmed printing (printers with confirm only).", ['printer'])
+bytes_sent_total = Counter('zpl_bytes_sent_total', "ZPL bytes sent to the printer.", ['printer'])
+jobs_total = Counter('zpl_jobs_total', "Finished print jobs by outcome.", ['printer', 'status'])
+job_queued_seconds = Histogram('zpl_job_queued_seconds', "Time print jobs waited in their printer's queue.",
+                               ['printer'])
+job_send_seconds = Histogram('zpl_job_send_seconds', "Time spent sending print jobs to the printer.",
+                             ['printer'])
+# The JSON catalog's load cache (catalog.cache_stats): a hit is served from
+# memory, a replay only reads the journal tail another process appended, a
+# miss reads the snapshot and the whole journal
+catalog_loads_total = CallbackCounter(
+    'zpl_catalog_loads_total', "JSON catalog loads by how the cache served them.", ['result'],
+    lambda: {(result,): catalog.cache_stats[stats_key]
+             for result, stats_key in (('hit', 'hits'), ('replay', 'replays'), ('miss', 'misses'))})
+catalog_compactions_total = CallbackCounter(
+    'zpl_catalog_compactions_total', "Catalog journal compactions into the snapshot.", [],
+    lambda: {(): catalog.cache_stats['compactions']})
+
+
+@contextlib.contextmanager
+def stage(name):
+    # Times a pipeline stage and counts the exceptions escaping it
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        errors_total.inc(stage=name, type=type(e).__name__)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage=name)
+
+
+def record_job(job):
+    # Called once per finished print_queue.PrintJob
+    printer = str(job.printer)
+    jobs_total.inc(printer=printer, status=job.status)
+    job_queued_seconds.observe(job.started_at - job.created_at, printer=printer)
+    job_send_seconds.observe(job.finished_at - job.started_at, printer=printer)
+    if job.status == 'done':
+        labels_sent_total.inc(job.label_count, printer=printer)
+    if job.labels_printed:
+        labels_printed_total.inc(job.labels_printed, printer=printer)
+    if log_job_timings:
+        job_log.info(json.dumps({
+            'job_id': job.id,
+            'printer': printer,
+            'description': job.description,
+            'status': job.status,
+            'error': job.error,
+            'label_count': job.label_count,
+            'labels_printed': job.labels_printed,
+            'queued_seconds': round(job.started_at - job.created_at, 6),
+            'send_seconds': round(job.finished_at - job.started_at, 6),
+        }))
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
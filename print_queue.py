@@ -0,0 +1,138 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Print jobs are queued per printer and drained by one background worker per
+# printer, so request handlers return as soon as a job is enqueued and a slow
+# or hung printer only ever ties up its own worker.
+#
+# A job whose printer reports an error (paper out, head open, ...) is
+# "paused": its worker holds it, and every job queued behind it, until the
+# printer is printing again.
+
+max_finished_jobs = 1000  # finished jobs kept around for status lookups
+
+
+class PrintJob:
+    def __init__(self, printer, data, description='', label_count=0):
+        self.id = uuid.uuid4().hex
+        self.printer = printer
+        self.data = data
+        self.description = description
+        self.label_count = label_count
+        self.status = 'queued'
+        self.error = None
+        self.labels_printed = None  # known only for printers that confirm jobs
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._finished = threading.Event()
+
+    def to_dict(self):
+        now = time.time()
+        job = {
+            'id': self.id,
+            'printer': str(self.printer),
+            'description': self.description,
+            'label_count': self.label_count,
+            'labels_printed': self.labels_printed,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        # Seconds spent waiting in the queue and talking to the printer so far
+        job['queued_seconds'] = (self.started_at or now) - self.created_at
+        if self.started_at is not None:
+            job['send_seconds'] = (self.finished_at or now) - self.started_at
+        return job
+
+    def wait(self, timeout=None):
+        # Blocks until the job is done or failed; False if timeout ran out
+        return self._finished.wait(timeout)
+
+    def progress(self, labels_printed, errors):
+        # Called by the sender while a job prints; errors pause the job
+        self.labels_printed = labels_printed
+        if errors:
+            self.status = 'paused'
+            self.error = f"Printer reports {', '.join(errors)}"
+        else:
+            self.status = 'sending'
+            self.error = None
+
+
+class PrintQueue:
+    def __init__(self, send, on_finished=None):
+        # send(printer, data, progress) delivers one job's payload and raises
+        # on failure. It returns the number of labels printed if the printer
+        # confirmed them (None otherwise) and may report progress along the
+        # way through progress(labels_printed, errors), see PrintJob.progress.
+        # on_finished(job), if given, is called after every job completes
+        self.send = send
+        self.on_finished = on_finished
+        self._queues = {}
+        self._pending = {}
+        self._jobs = OrderedDict()
+        self._finished = 0
+        self._lock = threading.Lock()
+
+    def submit(self, printer, data, description='', label_count=0):
+        job = PrintJob(printer, data, description, label_count)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._pending[printer] = self._pending.get(printer, 0) + 1
+            jobs = self._queues.get(printer)
+            if jobs is None:
+                jobs = queue.Queue()
+                self._queues[printer] = jobs
+                threading.Thread(target=self._worker, args=(jobs,),
+                                 name=f"print-worker-{printer}", daemon=True).start()
+        jobs.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self, printer):
+        # Jobs queued or being sent to the printer
+        with self._lock:
+            return self._pending.get(printer, 0)
+
+    def _worker(self, jobs):
+        while True:
+            job = jobs.get()
+            job.status = 'sending'
+            job.started_at = time.time()
+            try:
+                labels_printed = self.send(job.printer, job.data, job.progress)
+                if labels_printed is not None:
+                    job.labels_printed = labels_printed
+                job.status = 'done'
+                job.error = None
+            except Exception as e:
+                job.status = 'failed'
+                job.error = str(e)
+            job.finished_at = time.time()
+            job.data = None
+            self._finish(job)
+            if self.on_finished is not None:
+                self.on_finished(job)
+            job._finished.set()
+
+    def _finish(self, job):
+        with self._lock:
+            self._pending[job.printer] -= 1
+            self._finished += 1
+            if self._finished <= max_finished_jobs:
+                return
+            # Forget the oldest finished job
+            for job_id, old_job in self._jobs.items():
+                if old_job.status in ('done', 'failed'):
+                    del self._jobs[job_id]
+                    self._finished -= 1
+                    break
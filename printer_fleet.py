@@ -0,0 +1,183 @@
+import json
+import os
+import threading
+import time
+
+import printer_transport
+import zpl_templates
+
+# Printer registry and job routing for sites with several Zebras. Printers are
+# described in printers.json:
+#
+#   [{"name": "line1-a", "address": "10.0.0.21", "transport": "tcp",
+#     "label_size": [609, 406], "tags": ["line1", "shipping"]}, ...]
+#
+# "transport" is "tcp" (raw port 9100) or "usb" (a local Windows printer queue,
+# address being the printer name). Tags group printers into pools that jobs
+# can be routed to by "pool:<tag>". "stored_formats": true makes the printer
+# receive labels as recalls of a downloaded ^DF format (see zpl_templates).
+# "confirm": true (tcp only) checks ~HS host status around every job and waits
+# until the labels have printed (see printer_transport.send_confirmed).
+
+unhealthy_cooldown = 30  # seconds a printer is skipped after a failed send
+
+
+class Printer:
+    def __init__(self, name, address, transport='tcp', port=printer_transport.default_port,
+                 label_size=(609, 406), tags=(), stored_formats=False, confirm=False):
+        self.name = name
+        self.address = address
+        self.transport = transport
+        self.port = port
+        self.label_size = tuple(label_size)
+        self.tags = set(tags)
+        self.stored_formats = stored_formats
+        self.confirm = confirm
+
+    def send(self, data, stored_format=None, progress=None):
+        # Returns the number of labels printed when the printer confirms them,
+        # otherwise None (the data was accepted, nothing more is known).
+        # progress is passed on to printer_transport's send_confirmed.
+        if self.transport == 'usb':
+            # Spooled jobs carry no connection state, so send the format along
+            if stored_format is not None:
+                data = stored_format.definition + data
+            printer_transport.send_to_windows_printer(self.address, data)
+        elif self.confirm:
+            connection = printer_transport.pool.connection(self.address, self.port)
+            return connection.send_confirmed(data, stored_format, progress)
+        else:
+            printer_transport.send_raw(self.address, data, self.port, stored_format)
+        return None
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'address': self.address,
+            'transport': self.transport,
+            'port': self.port,
+            'label_size': list(self.label_size),
+            'tags': sorted(self.tags),
+            'stored_formats': self.stored_formats,
+            'confirm': self.confirm,
+        }
+
+
+class PrinterRegistry:
+    def __init__(self, printers=()):
+        self._printers = {}
+        self._failed_at = {}
+        self._lock = threading.Lock()
+        for printer in printers:
+            self.add(printer)
+
+    def add(self, printer):
+        self._printers[printer.name] = printer
+
+    def get(self, name):
+        return self._printers.get(name)
+
+    def all(self):
+        return list(self._printers.values())
+
+    def pools(self):
+        return sorted({tag for printer in self._printers.values() for tag in printer.tags})
+
+    def resolve(self, target):
+        # "" means every printer, "pool:<tag>" a pool, anything else one printer
+        if not target:
+            return self.all()
+        if target.startswith('pool:'):
+            tag = target[len('pool:'):]
+            return [printer for printer in self._printers.values() if tag in printer.tags]
+        printer = self.get(target)
+        return [printer] if printer is not None else []
+
+    def mark_failed(self, name):
+        with self._lock:
+            self._failed_at[name] = time.monotonic()
+
+    def mark_ok(self, name):
+        with self._lock:
+            self._failed_at.pop(name, None)
+
+    def is_healthy(self, name):
+        with self._lock:
+            failed_at = self._failed_at.get(name)
+        return failed_at is None or time.monotonic() - failed_at > unhealthy_cooldown
+
+
+def load_registry(path, default_address=None, stored_formats=False, confirm=False):
+    # Without a printers.json the single configured printer is the whole fleet
+    if not os.path.exists(path):
+        printers = []
+        if default_address:
+            printers.append(Printer('default', default_address, stored_formats=stored_formats, confirm=confirm))
+        return PrinterRegistry(printers)
+
+    with open(path, 'r') as file:
+        entries = json.load(file)
+    defaults = {'stored_formats': stored_formats, 'confirm': confirm}
+    return PrinterRegistry(Printer(**dict(defaults, **entry)) for entry in entries)
+
+
+class PrinterScheduler:
+    def __init__(self, registry, print_jobs):
+        self.registry = registry
+        self.print_jobs = print_jobs
+
+    def candidates(self, target, label_size=None):
+        # Printers for target that can take the label, healthiest and least
+        # busy first. Unhealthy printers are only used if nothing else is left.
+        printers = [printer for printer in self.registry.resolve(target)
+                    if label_size is None or printer.label_size == tuple(label_size)]
+        return sorted(printers, key=lambda printer: (
+            not self.registry.is_healthy(printer.name), self.print_jobs.pending(printer.name)))
+
+    def pick(self, target, label_size=None):
+        printers = self.candidates(target, label_size)
+        return printers[0] if printers else None
+
+    def split(self, target, batch, label_size=None):
+        # Spreads a label batch (label_core.label_batch entries) over the
+        # healthy printers in target as contiguous runs with even label
+        # counts, so each printer's output stays in kit order. A ^PQ entry
+        # that crosses a run boundary is divided between the two printers.
+        # Returns [(printer, batch), ...].
+        printers = self.candidates(target, label_size)
+        healthy = [printer for printer in printers if self.registry.is_healthy(printer.name)]
+        printers = healthy or printers[:1]
+        total = sum(entry[2] for entry in batch)
+        if not printers or not total:
+            return []
+
+        printers = printers[:total]
+        size, extra = divmod(total, len(printers))
+        entries = iter(batch)
+        entry = None
+        runs = []
+        for index, printer in enumerate(printers):
+            wanted = size + (1 if index < extra else 0)
+            run = []
+            while wanted:
+                if entry is None:
+                    entry = next(entries)
+                if entry[2] <= wanted:
+                    run.append(entry)
+                    wanted -= entry[2]
+                    entry = None
+                else:
+                    head, entry = _split_entry(entry, wanted)
+                    run.append(head)
+                    wanted = 0
+            runs.append((printer, run))
+        return runs
+
+
+def _split_entry(entry, count):
+    # The first count labels of a batch entry and the rest. The rest of a
+    # counting (^SN) run starts at the part number after the last one taken.
+    part_number, description, quantity, serial = entry[:4]
+    rest_number = zpl_templates.counter_part_number(part_number, count) if serial else part_number
+    return ((part_number, description, count) + entry[3:],
+            (rest_number, description, quantity - count) + entry[3:])
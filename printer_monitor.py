@@ -0,0 +1,77 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import printer_transport
+
+# Background health checks for every printer in the registry. Each round
+# makes sure the printer's pooled 9100 connection is up (optionally asking
+# for ~HS host status over it) and caches the outcome, so page loads and the
+# scheduler read printer status from memory instead of probing the network.
+# A printer reporting an error (paper out, head open, ...) counts as unhealthy.
+
+probe_interval = 10      # seconds between probe rounds
+query_host_status = False  # also send ~HS and keep the parsed reply
+
+
+class PrinterMonitor:
+    def __init__(self, registry, interval=probe_interval, host_status=query_host_status):
+        self.registry = registry
+        self.interval = interval
+        self.host_status = host_status
+        self._statuses = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='printer-monitor', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=8, thread_name_prefix='printer-probe') as executor:
+            while not self._stop.is_set():
+                # Probes run in parallel so one unreachable printer's connect
+                # timeout does not delay everyone else's status
+                list(executor.map(self.probe, self.registry.all()))
+                self._stop.wait(self.interval)
+
+    def probe(self, printer):
+        status = {'online': None, 'checked_at': time.time(), 'latency_ms': None, 'error': None, 'errors': []}
+        if printer.transport == 'tcp':
+            connection = printer_transport.pool.connection(printer.address, printer.port)
+            started = time.monotonic()
+            try:
+                if self.host_status:
+                    status['host_status'] = connection.host_status()
+                    status['errors'] = status['host_status']['errors']
+                else:
+                    connection.check()
+                status['online'] = True
+                status['latency_ms'] = round((time.monotonic() - started) * 1000, 1)
+            except printer_transport.PrinterError as e:
+                status['online'] = False
+                status['error'] = str(e)
+
+            if status['online'] and not status['errors']:
+                self.registry.mark_ok(printer.name)
+            else:
+                self.registry.mark_failed(printer.name)
+
+        with self._lock:
+            self._statuses[printer.name] = status
+        return status
+
+    def status(self, name):
+        # None until the first probe of the printer has finished
+        with self._lock:
+            return self._statuses.get(name)
+
+    def statuses(self):
+        with self._lock:
+            return dict(self._statuses)
@@ -0,0 +1,353 @@
+import select
+import socket
+import threading
+import time
+
+# Raw TCP transport for Zebra printers (port 9100 takes plain ZPL, no HTTP).
+# One keep-alive socket is kept open per printer and reused across jobs; it is
+# reopened transparently when the printer has dropped it or it sat idle for
+# longer than idle_timeout.
+#
+# Each connection remembers which ZPL stored formats (see zpl_templates) it
+# has downloaded to the printer, and downloads a format again only when its
+# version changed or the connection was reopened (the printer may have
+# restarted and lost its DRAM).
+#
+# send_confirmed() brackets a batch with ~HS host status queries: it holds the
+# batch while the printer reports an error (paper out, head open, ...) and then
+# polls until the printer has printed it, reporting how many labels came out.
+# A healthy printer costs one query per batch plus the completion polls, never
+# one per label.
+
+default_port = 9100
+connect_timeout = 5   # seconds to establish the TCP connection
+send_timeout = 30     # seconds a blocked send may stall before giving up
+idle_timeout = 60     # seconds an unused connection is kept open
+query_timeout = 3     # seconds to wait for the reply to a status query
+status_max_age = 1    # seconds a healthy ~HS reply stands in for the pre-batch query
+status_poll_interval = 0.5  # seconds between completion polls
+pause_poll_interval = 2     # seconds between polls of a printer in an error state
+completion_timeout = 60     # seconds a healthy printer may print nothing before the batch fails
+pause_timeout = 1800        # seconds a batch waits for an operator to clear an error
+
+# Host status conditions that stop the printer from printing
+status_errors = ['paper_out', 'paused', 'head_up', 'ribbon_out', 'buffer_full', 'corrupt_ram',
+                 'under_temperature', 'over_temperature']
+
+
+class PrinterError(Exception):
+    pass
+
+
+class PrinterStatusError(PrinterError):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_host_status(reply):
+    # The three STX...ETX strings of a ~HS reply:
+    #   aaa,b,c,dddd,eee,f,g,h,iii,j,k,l   b paper out, c paused, eee formats
+    #                                      in the buffer, f buffer full, j
+    #                                      corrupt RAM, k/l under/over temperature
+    #   mmm,n,o,p,q,r,s,t,uuuuuuuu,v,www   o head up, p ribbon out, uuuuuuuu
+    #                                      labels left in the format printing
+    #   xxxx,y
+    if isinstance(reply, bytes):
+        reply = reply.decode('ascii', 'replace')
+    strings = [frame.split('\x03')[0].split(',') for frame in reply.split('\x02')[1:]]
+    try:
+        first, second = strings[0], strings[1]
+        status = {
+            'paper_out': first[1] == '1',
+            'paused': first[2] == '1',
+            'formats_in_buffer': int(first[4]),
+            'buffer_full': first[5] == '1',
+            'corrupt_ram': first[9] == '1',
+            'under_temperature': first[10] == '1',
+            'over_temperature': first[11] == '1',
+            'head_up': second[2] == '1',
+            'ribbon_out': second[3] == '1',
+            'labels_remaining': int(second[8]),
+        }
+    except (IndexError, ValueError):
+        raise PrinterError(f"Malformed host status reply: {reply!r}")
+    status['errors'] = [name for name in status_errors if status[name]]
+    return status
+
+
+def format_label_counts(data):
+    # Labels printed by each ^XA...^XZ format in data (^PQ quantity, default 1)
+    counts = []
+    for label_format in data.split(b'^XZ')[:-1]:
+        quantity = 1
+        quantity_at = label_format.rfind(b'^PQ')
+        if quantity_at != -1:
+            digits = label_format[quantity_at + 3:].split(b',')[0].split(b'^')[0].strip()
+            quantity = int(digits) if digits.isdigit() else 1
+        counts.append(quantity)
+    return counts
+
+
+def labels_printed(counts, status):
+    # How many labels of a batch (labels per format, as sent) have printed,
+    # given host status taken after the batch was sent. The batch is taken to
+    # be the last formats the printer received: formats still waiting in the
+    # buffer, and the one it is printing, are the batch's last ones.
+    printing = 1 if status['labels_remaining'] else 0
+    pending = min(len(counts), status['formats_in_buffer'] + printing)
+    done = len(counts) - pending
+    printed = sum(counts[:done])
+    if printing and pending > status['formats_in_buffer']:
+        printed += max(0, counts[done] - status['labels_remaining'])
+    return printed
+
+
+class PrinterConnection:
+    def __init__(self, address, port=default_port):
+        self.address = address
+        self.port = port
+        self.lock = threading.Lock()
+        self.sock = None
+        self.last_used = 0.0
+        self.stored_formats = {}
+        self.last_status = None
+        self.last_status_at = 0.0
+
+    def _open(self):
+        sock = socket.create_connection((self.address, self.port), timeout=connect_timeout)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(send_timeout)
+        self.sock = sock
+        self.stored_formats = {}
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def _is_usable(self):
+        if self.sock is None or time.monotonic() - self.last_used > idle_timeout:
+            return False
+        # A socket the printer has closed polls readable and reads EOF
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+            if readable and self.sock.recv(1, socket.MSG_PEEK) == b'':
+                return False
+        except OSError:
+            return False
+        return True
+
+    def _send_once(self, data, stored_format):
+        # Returns how many bytes of data were handed to the socket, also when
+        # the send fails partway (as the OSError's .sent)
+        if self.sock is None:
+            self._open()
+        if stored_format is not None and self.stored_formats.get(stored_format.name) != stored_format.version:
+            self.sock.sendall(stored_format.definition)
+            self.stored_formats[stored_format.name] = stored_format.version
+        view = memoryview(data)
+        sent = 0
+        try:
+            while sent < len(view):
+                sent += self.sock.send(view[sent:])
+        except OSError as e:
+            e.sent = sent
+            raise
+        return sent
+
+    def send(self, data, stored_format=None):
+        with self.lock:
+            reused = self._is_usable()
+            if not reused:
+                self.close()
+            try:
+                self._send_once(data, stored_format)
+            except OSError as e:
+                self.close()
+                # Once part of the job has gone out the printer may already
+                # be printing it, and resending would print labels twice
+                if not reused or getattr(e, 'sent', 0):
+                    raise PrinterError(f"Failed to send to printer at {self.address}:{self.port}: {e}")
+                # The kept-alive socket went away under us (printer restart,
+                # network blip) before any label was written; retry once on a
+                # fresh connection. A stored format definition prints nothing,
+                # so resending one is harmless.
+                try:
+                    self._send_once(data, stored_format)
+                except OSError as e:
+                    self.close()
+                    raise PrinterError(f"Failed to send to printer at {self.address}:{self.port}: {e}")
+            self.last_used = time.monotonic()
+
+    def check(self):
+        # Makes sure the kept-alive connection is up, opening it if needed.
+        # A connection busy sending a job is evidently alive.
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            if not self._is_usable():
+                self.close()
+                try:
+                    self._open()
+                except OSError as e:
+                    raise PrinterError(f"Printer at {self.address}:{self.port} is unreachable: {e}")
+                self.last_used = time.monotonic()
+        finally:
+            self.lock.release()
+
+    def query(self, command, replies=1, timeout=query_timeout):
+        # Sends a status command such as ~HS and returns the raw reply once
+        # `replies` STX...ETX frames have arrived
+        with self.lock:
+            try:
+                if not self._is_usable():
+                    self.close()
+                    self._open()
+                self._drain()
+                self.sock.sendall(command)
+                reply = b''
+                deadline = time.monotonic() + timeout
+                while reply.count(b'\x03') < replies:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PrinterError(f"No reply to {command!r} from printer at {self.address}:{self.port}")
+                    self.sock.settimeout(remaining)
+                    chunk = self.sock.recv(4096)
+                    if not chunk:
+                        raise PrinterError(f"Printer at {self.address}:{self.port} closed the connection")
+                    reply += chunk
+            except OSError as e:
+                self.close()
+                raise PrinterError(f"Failed to query printer at {self.address}:{self.port}: {e}")
+            except PrinterError:
+                self.close()
+                raise
+            finally:
+                if self.sock is not None:
+                    self.sock.settimeout(send_timeout)
+            self.last_used = time.monotonic()
+            return reply
+
+    def host_status(self):
+        status = parse_host_status(self.query(b'~HS', replies=3))
+        self.last_status = status
+        self.last_status_at = time.monotonic()
+        return status
+
+    def _wait_for_errors(self, status, progress, printed=0):
+        # Polls a printer in an error state until it clears; returns the
+        # status that no longer has errors
+        paused_at = time.monotonic()
+        reported = None
+        while status['errors']:
+            if progress is not None and status['errors'] != reported:
+                reported = status['errors']
+                progress(printed, reported)
+            if time.monotonic() - paused_at > pause_timeout:
+                raise PrinterStatusError(f"Printer at {self.address}:{self.port} reports "
+                                         f"{', '.join(status['errors'])}", status)
+            time.sleep(pause_poll_interval)
+            status = self.host_status()
+        return status
+
+    def send_confirmed(self, data, stored_format=None, progress=None):
+        # progress(labels_printed, errors) is called whenever either changes;
+        # errors is an empty list once the printer is printing again. Returns
+        # the number of labels printed, which is every label in data unless
+        # this raises.
+        counts = format_label_counts(data)
+        total = sum(counts)
+        status = self.last_status
+        if status is None or status['errors'] or time.monotonic() - self.last_status_at > status_max_age:
+            status = self.host_status()
+        if status['errors']:
+            self._wait_for_errors(status, progress)
+            if progress is not None:
+                progress(0, [])
+        self.send(data, stored_format)
+
+        # The ~HS queries follow the batch on the same connection, so the
+        # printer has read every format of it by the time it answers
+        reported = 0
+        progress_at = time.monotonic()
+        while True:
+            status = self.host_status()
+            if status['errors']:
+                status = self._wait_for_errors(status, progress, labels_printed(counts, status))
+                reported = None
+            printed = labels_printed(counts, status)
+            if printed != reported:
+                reported = printed
+                progress_at = time.monotonic()
+                if progress is not None:
+                    progress(printed, [])
+            if printed >= total:
+                return printed
+            if time.monotonic() - progress_at > completion_timeout:
+                raise PrinterError(f"Printer at {self.address}:{self.port} stopped after {printed} "
+                                   f"of {total} labels")
+            time.sleep(status_poll_interval)
+
+    def _drain(self):
+        # Discard anything unsolicited the printer sent since the last query
+        while select.select([self.sock], [], [], 0)[0]:
+            if not self.sock.recv(4096):
+                raise OSError("connection closed by printer")
+
+
+class PrinterConnectionPool:
+    def __init__(self):
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def connection(self, address, port=default_port):
+        with self._lock:
+            connection = self._connections.get((address, port))
+            if connection is None:
+                connection = PrinterConnection(address, port)
+                self._connections[(address, port)] = connection
+            return connection
+
+    def send(self, address, data, port=default_port, stored_format=None):
+        self.connection(address, port).send(data, stored_format)
+
+    def close_all(self):
+        with self._lock:
+            connections = list(self._connections.values())
+        for connection in connections:
+            with connection.lock:
+                connection.close()
+
+
+pool = PrinterConnectionPool()
+
+
+def send_raw(address, data, port=default_port, stored_format=None):
+    if isinstance(data, str):
+        data = data.encode()
+    pool.send(address, data, port, stored_format)
+
+
+def send_to_windows_printer(printer_name, data):
+    # Raw job to a local Windows print queue (USB printers). win32print is only
+    # available on Windows, so it is imported when actually needed.
+    import win32print
+
+    if isinstance(data, str):
+        data = data.encode()
+    hPrinter = win32print.OpenPrinter(printer_name)
+    try:
+        win32print.StartDocPrinter(hPrinter, 1, ("ZPL Label", None, "RAW"))
+        try:
+            win32print.StartPagePrinter(hPrinter)
+            win32print.WritePrinter(hPrinter, data)
+            win32print.EndPagePrinter(hPrinter)
+        finally:
+            win32print.EndDocPrinter(hPrinter)
+    finally:
+        win32print.ClosePrinter(hPrinter)
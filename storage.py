@@ -0,0 +1,389 @@
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+import catalog
+
+# Label data storage backends. Both expose the same nested
+# {kit_number: {part_number: part_data}} view through load(), which returns the
+# same shared dict until the catalog changes, plus per-part mutations so the
+# front ends never read-modify-write the whole catalog themselves.
+
+
+class LabelStorage:
+    def load(self):
+        raise NotImplementedError
+
+    def kit_numbers(self):
+        return list(self.load())
+
+    def get_kit(self, kit_number):
+        return self.load().get(kit_number)
+
+    def list_kits(self, offset, limit):
+        # One page of kits: ([(kit_number, part_count), ...], total kits)
+        label_data = self.load()
+        page = itertools.islice(label_data.items(), offset, offset + limit)
+        return [(kit_number, len(parts)) for kit_number, parts in page], len(label_data)
+
+    def list_parts(self, kit_number, offset, limit):
+        # One page of a kit's parts in print order: ([part_data, ...], total
+        # parts), or None for an unknown kit
+        parts = self.load().get(kit_number)
+        if parts is None:
+            return None
+        return list(itertools.islice(parts.values(), offset, offset + limit)), len(parts)
+
+    def find_part(self, part_number):
+        # Returns [(kit_number, part_data), ...] for every kit holding the part
+        return [(kit_number, parts[part_number])
+                for kit_number, parts in self.load().items() if part_number in parts]
+
+    def store_part(self, kit_number, part_number, part_data):
+        raise NotImplementedError
+
+    def delete_part(self, kit_number, part_number):
+        raise NotImplementedError
+
+    def move_part(self, kit_number, part_number, direction):
+        raise NotImplementedError
+
+    def replace_kits(self, kits):
+        # Replaces (or with None deletes) whole kits in one write
+        raise NotImplementedError
+
+    def update_kit(self, kit_number, update):
+        # Atomic read-modify-write of one kit, safe against concurrent writers
+        # in this and other processes: update(parts) maps the kit's current
+        # contents ({} if new) to its new ones (empty deletes it). Nothing is
+        # written if update raises. Returns the new contents.
+        raise NotImplementedError
+
+    def replace_all(self, label_data):
+        raise NotImplementedError
+
+
+class JsonFileStorage(LabelStorage):
+    # label_data.json plus its journal, see catalog.py
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        return catalog.load_label_data(self.path)
+
+    def store_part(self, kit_number, part_number, part_data):
+        catalog.store_part(self.path, kit_number, part_number, part_data)
+
+    def delete_part(self, kit_number, part_number):
+        return catalog.delete_part(self.path, kit_number, part_number)
+
+    def move_part(self, kit_number, part_number, direction):
+        return catalog.move_part(self.path, kit_number, part_number, direction)
+
+    def replace_kits(self, kits):
+        catalog.replace_kits(self.path, kits)
+
+    def update_kit(self, kit_number, update):
+        return catalog.update_kit(self.path, kit_number, update)
+
+    def replace_all(self, label_data):
+        catalog.save_label_data(label_data, self.path)
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS kits (
+    kit_id INTEGER PRIMARY KEY,
+    kit_number TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS parts (
+    kit_number TEXT NOT NULL,
+    part_number TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (kit_number, part_number)
+);
+CREATE INDEX IF NOT EXISTS parts_by_kit_position ON parts (kit_number, position);
+CREATE INDEX IF NOT EXISTS parts_by_part_number ON parts (part_number);
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('version', 0);
+"""
+
+
+class SqliteStorage(LabelStorage):
+    # Every write bumps catalog_meta.version in the same transaction. load()
+    # keeps the assembled dict in memory and only rebuilds it when the version
+    # moved for a reason other than our own writes (i.e. another process).
+    def __init__(self, path, import_from=None):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._data = None
+        self._version = None
+
+        self._connection().connection.executescript(_schema)
+        if import_from and self._is_empty() and (
+                os.path.exists(import_from) or os.path.exists(catalog.journal_path(import_from))):
+            migrate_json_to_sqlite(import_from, self)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return _Transaction(connection)
+
+    def _is_empty(self):
+        with self._connection() as connection:
+            return connection.execute('SELECT 1 FROM parts LIMIT 1').fetchone() is None
+
+    def _read_version(self, connection):
+        return connection.execute("SELECT value FROM catalog_meta WHERE key = 'version'").fetchone()[0]
+
+    def _bump_version(self, connection):
+        connection.execute("UPDATE catalog_meta SET value = value + 1 WHERE key = 'version'")
+        return self._read_version(connection)
+
+    def load(self):
+        with self._lock:
+            with self._connection() as connection:
+                version = self._read_version(connection)
+                if self._data is not None and version == self._version:
+                    return self._data
+
+                label_data = {}
+                rows = connection.execute(
+                    'SELECT parts.kit_number, parts.part_number, parts.data FROM parts '
+                    'JOIN kits ON kits.kit_number = parts.kit_number '
+                    'ORDER BY kits.kit_id, parts.position')
+                for kit_number, part_number, data in rows:
+                    label_data.setdefault(kit_number, {})[part_number] = json.loads(data)
+            self._data = label_data
+            self._version = version
+            return label_data
+
+    def _after_write(self, version, apply):
+        # Keep the cached dict in step with our own write, unless another
+        # process also wrote in between, in which case the next load() rebuilds.
+        # apply() gets a new top-level dict and replaces the kits it changes
+        # rather than modifying them, since other threads may be iterating
+        # the dict load() returned.
+        if self._data is not None and version == self._version + 1:
+            label_data = dict(self._data)
+            apply(label_data)
+            self._data = label_data
+            self._version = version
+        else:
+            self._data = None
+
+    def kit_numbers(self):
+        with self._connection() as connection:
+            return [row[0] for row in connection.execute(
+                'SELECT kit_number FROM kits ORDER BY kit_id')]
+
+    def get_kit(self, kit_number):
+        with self._connection() as connection:
+            rows = connection.execute(
+                'SELECT part_number, data FROM parts WHERE kit_number = ? ORDER BY position',
+                (kit_number,)).fetchall()
+        if not rows:
+            return None
+        return {part_number: json.loads(data) for part_number, data in rows}
+
+    def find_part(self, part_number):
+        with self._connection() as connection:
+            rows = connection.execute(
+                'SELECT parts.kit_number, parts.data FROM parts '
+                'JOIN kits ON kits.kit_number = parts.kit_number '
+                'WHERE parts.part_number = ? ORDER BY kits.kit_id', (part_number,)).fetchall()
+        return [(kit_number, json.loads(data)) for kit_number, data in rows]
+
+    def store_part(self, kit_number, part_number, part_data):
+        data = json.dumps(part_data)
+        with self._lock:
+            with self._connection().write() as connection:
+                connection.execute('INSERT OR IGNORE INTO kits (kit_number) VALUES (?)', (kit_number,))
+                updated = connection.execute(
+                    'UPDATE parts SET data = ? WHERE kit_number = ? AND part_number = ?',
+                    (data, kit_number, part_number)).rowcount
+                if not updated:
+                    connection.execute(
+                        'INSERT INTO parts (kit_number, part_number, position, data) '
+                        'SELECT ?, ?, COALESCE(MAX(position), -1) + 1, ? FROM parts WHERE kit_number = ?',
+                        (kit_number, part_number, data, kit_number))
+                version = self._bump_version(connection)
+
+            def apply(label_data):
+                parts = dict(label_data.get(kit_number, {}))
+                parts[part_number] = part_data
+                label_data[kit_number] = parts
+            self._after_write(version, apply)
+
+    def delete_part(self, kit_number, part_number):
+        with self._lock:
+            with self._connection().write() as connection:
+                deleted = connection.execute(
+                    'DELETE FROM parts WHERE kit_number = ? AND part_number = ?',
+                    (kit_number, part_number)).rowcount
+                if not deleted:
+                    return False
+                connection.execute(
+                    'DELETE FROM kits WHERE kit_number = ? AND NOT EXISTS '
+                    '(SELECT 1 FROM parts WHERE kit_number = ?)', (kit_number, kit_number))
+                version = self._bump_version(connection)
+
+            def apply(label_data):
+                parts = dict(label_data.get(kit_number, {}))
+                parts.pop(part_number, None)
+                if parts:
+                    label_data[kit_number] = parts
+                else:
+                    label_data.pop(kit_number, None)
+            self._after_write(version, apply)
+            return True
+
+    def move_part(self, kit_number, part_number, direction):
+        if direction == 'up':
+            neighbour_query = ('SELECT part_number, position FROM parts WHERE kit_number = ? '
+                               'AND position < ? ORDER BY position DESC LIMIT 1')
+        elif direction == 'down':
+            neighbour_query = ('SELECT part_number, position FROM parts WHERE kit_number = ? '
+                               'AND position > ? ORDER BY position LIMIT 1')
+        else:
+            return False
+
+        with self._lock:
+            with self._connection().write() as connection:
+                row = connection.execute(
+                    'SELECT position FROM parts WHERE kit_number = ? AND part_number = ?',
+                    (kit_number, part_number)).fetchone()
+                if row is None:
+                    return False
+                position = row[0]
+                neighbour = connection.execute(neighbour_query, (kit_number, position)).fetchone()
+                if neighbour is None:
+                    return True
+                neighbour_part, neighbour_position = neighbour
+                # Swapping two positions is the whole move
+                connection.execute(
+                    'UPDATE parts SET position = ? WHERE kit_number = ? AND part_number = ?',
+                    (neighbour_position, kit_number, part_number))
+                connection.execute(
+                    'UPDATE parts SET position = ? WHERE kit_number = ? AND part_number = ?',
+                    (position, kit_number, neighbour_part))
+                version = self._bump_version(connection)
+
+            def apply(label_data):
+                parts = list(label_data[kit_number].items())
+                index = next(i for i, (part, _) in enumerate(parts) if part == part_number)
+                other = index - 1 if direction == 'up' else index + 1
+                parts[index], parts[other] = parts[other], parts[index]
+                label_data[kit_number] = dict(parts)
+            self._after_write(version, apply)
+            return True
+
+    def _write_kits(self, connection, kits):
+        for kit_number, parts in kits.items():
+            connection.execute('DELETE FROM parts WHERE kit_number = ?', (kit_number,))
+            if not parts:
+                connection.execute('DELETE FROM kits WHERE kit_number = ?', (kit_number,))
+                continue
+            connection.execute('INSERT OR IGNORE INTO kits (kit_number) VALUES (?)', (kit_number,))
+            connection.executemany(
+                'INSERT INTO parts (kit_number, part_number, position, data) VALUES (?, ?, ?, ?)',
+                [(kit_number, part_number, position, json.dumps(part_data))
+                 for position, (part_number, part_data) in enumerate(parts.items())])
+        version = self._bump_version(connection)
+
+        def apply(label_data):
+            for kit_number, parts in kits.items():
+                if parts:
+                    label_data[kit_number] = dict(parts)
+                else:
+                    label_data.pop(kit_number, None)
+        return version, apply
+
+    def replace_kits(self, kits):
+        with self._lock:
+            with self._connection().write() as connection:
+                version, apply = self._write_kits(connection, kits)
+            self._after_write(version, apply)
+
+    def update_kit(self, kit_number, update):
+        with self._lock:
+            # BEGIN IMMEDIATE: no other writer can change the kit between
+            # reading it here and writing it back
+            with self._connection().write() as connection:
+                rows = connection.execute(
+                    'SELECT part_number, data FROM parts WHERE kit_number = ? ORDER BY position',
+                    (kit_number,)).fetchall()
+                parts = update({part_number: json.loads(data) for part_number, data in rows})
+                version, apply = self._write_kits(connection, {kit_number: parts or None})
+            self._after_write(version, apply)
+            return parts
+
+    def replace_all(self, label_data):
+        with self._lock:
+            with self._connection().write() as connection:
+                connection.execute('DELETE FROM parts')
+                connection.execute('DELETE FROM kits')
+                for kit_number, parts in label_data.items():
+                    connection.execute('INSERT INTO kits (kit_number) VALUES (?)', (kit_number,))
+                    connection.executemany(
+                        'INSERT INTO parts (kit_number, part_number, position, data) VALUES (?, ?, ?, ?)',
+                        [(kit_number, part_number, position, json.dumps(part_data))
+                         for position, (part_number, part_data) in enumerate(parts.items())])
+                self._bump_version(connection)
+            self._data = None
+
+
+class _Transaction:
+    # "with storage._connection() as c" runs a deferred read transaction,
+    # ".write()" takes the write lock up front so concurrent writers queue
+    # instead of failing with SQLITE_BUSY halfway through
+    def __init__(self, connection, begin='BEGIN'):
+        self.connection = connection
+        self.begin = begin
+
+    def write(self):
+        return _Transaction(self.connection, 'BEGIN IMMEDIATE')
+
+    def __enter__(self):
+        self.connection.execute(self.begin)
+        return self.connection
+
+    def __exit__(self, exc_type, exc, tb):
+        self.connection.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+        return False
+
+
+def migrate_json_to_sqlite(json_path, target):
+    # One-shot import of an existing label_data.json (journal included)
+    if isinstance(target, str):
+        target = SqliteStorage(target)
+    target.replace_all(catalog.load_label_data(json_path))
+    return target
+
+
+def open_storage(backend, json_path, db_path):
+    if backend == 'json':
+        return JsonFileStorage(json_path)
+    if backend == 'sqlite':
+        # The first start against an empty database imports label_data.json
+        return SqliteStorage(db_path, import_from=json_path)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'migrate':
+        print("Usage: python storage.py migrate <label_data.json> <label_data.db>")
+        sys.exit(1)
+    storage = migrate_json_to_sqlite(sys.argv[2], sys.argv[3])
+    print(f"Migrated {sum(len(parts) for parts in storage.load().values())} parts into {sys.argv[3]}")
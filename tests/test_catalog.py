@@ -0,0 +1,154 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import catalog
+import kit_batch
+import storage
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def part(part_number, description='part'):
+    return kit_batch.part_entry(part_number, description)
+
+
+def reload(path):
+    # What a fresh process would read from disk
+    catalog.invalidate_cache(path)
+    return catalog.load_label_data(path)
+
+
+def test_store_move_delete_survive_reload(tmp_path):
+    path = str(tmp_path / 'label_data.json')
+    for part_number in ('A', 'B', 'C'):
+        catalog.store_part(path, 'K1', part_number, part(part_number))
+    catalog.store_part(path, 'K2', 'X', part('X'))
+    assert catalog.move_part(path, 'K1', 'C', 'up')
+    assert catalog.delete_part(path, 'K1', 'A')
+    assert not catalog.delete_part(path, 'K1', 'A')
+    assert catalog.delete_part(path, 'K2', 'X')
+
+    label_data = catalog.load_label_data(path)
+    assert list(label_data) == ['K1']
+    assert list(label_data['K1']) == ['C', 'B']
+    assert reload(path) == label_data
+
+
+def test_writes_copy_instead_of_changing_the_loaded_dict(tmp_path):
+    path = str(tmp_path / 'label_data.json')
+    catalog.save_label_data({'K1': {'A': part('A')}, 'K2': {'B': part('B')}}, path)
+    before = catalog.load_label_data(path)
+    snapshot = json.loads(json.dumps(before))
+
+    catalog.store_part(path, 'K1', 'C', part('C'))
+    catalog.update_kit(path, 'K3', lambda parts: {'D': part('D')})
+    after = catalog.load_label_data(path)
+
+    assert before == snapshot
+    assert after is not before
+    assert list(after['K1']) == ['A', 'C']
+    # Untouched kits are shared between versions
+    assert after['K2'] is before['K2']
+    assert catalog.load_label_data(path) is after
+
+
+def test_torn_journal_tail_is_cut_before_appending(tmp_path):
+    path = str(tmp_path / 'label_data.json')
+    catalog.store_part(path, 'K1', 'A', part('A'))
+    # A crash in the middle of another process's append
+    with open(catalog.journal_path(path), 'ab') as file:
+        file.write(b'{"op": "store", "kit": "K1", "part": "TORN", "da')
+
+    assert list(reload(path)['K1']) == ['A']
+    catalog.store_part(path, 'K1', 'B', part('B'))
+    assert list(reload(path)['K1']) == ['A', 'B']
+
+
+def test_appends_from_another_process_are_replayed(tmp_path):
+    path = str(tmp_path / 'label_data.json')
+    catalog.store_part(path, 'K1', 'A', part('A'))
+    catalog.load_label_data(path)
+    replays = catalog.cache_stats['replays']
+
+    code = ("import catalog, kit_batch, sys\n"
+            "for index in range(50):\n"
+            "    catalog.store_part(sys.argv[1], 'K1', f'P{index}', kit_batch.part_entry(f'P{index}', 'other'))\n")
+    other = subprocess.Popen([sys.executable, '-c', code, path], cwd=repo_dir)
+    for index in range(50):
+        catalog.store_part(path, 'K1', f'L{index}', part(f'L{index}'))
+    assert other.wait(timeout=60) == 0
+
+    label_data = catalog.load_label_data(path)
+    assert len(label_data['K1']) == 101
+    assert catalog.cache_stats['replays'] > replays
+    assert reload(path) == label_data
+
+
+def test_compaction_folds_the_journal_into_the_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog, 'journal_compact_bytes', 2048)
+    path = str(tmp_path / 'label_data.json')
+    for index in range(40):
+        catalog.store_part(path, 'K1', f'P{index}', part(f'P{index}'))
+    catalog.compact(path)
+    catalog.store_part(path, 'K1', 'LAST', part('LAST'))
+
+    journal_size = os.path.getsize(catalog.journal_path(path))
+    assert journal_size < 2048
+    label_data = catalog.load_label_data(path)
+    assert len(label_data['K1']) == 41
+    with open(path) as file:
+        assert len(json.load(file)['K1']) >= 40
+    assert reload(path) == label_data
+
+
+def test_concurrent_update_kit_loses_nothing(tmp_path):
+    path = str(tmp_path / 'label_data.json')
+
+    def add_parts(prefix):
+        for index in range(25):
+            catalog.update_kit(path, 'K1', lambda parts: dict(parts, **{f'{prefix}{index}': part(f'{prefix}{index}')}))
+
+    threads = [threading.Thread(target=add_parts, args=(prefix,)) for prefix in 'ABCD']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(reload(path)['K1']) == 100
+
+
+def test_sqlite_move_part_and_update_kit(tmp_path):
+    path = str(tmp_path / 'label_data.db')
+    sqlite_storage = storage.SqliteStorage(path)
+    sqlite_storage.replace_all({'K1': {'A': part('A'), 'B': part('B'), 'C': part('C')}})
+    before = sqlite_storage.load()
+
+    assert sqlite_storage.move_part('K1', 'C', 'up')
+    assert sqlite_storage.move_part('K1', 'A', 'up')
+    assert not sqlite_storage.move_part('K1', 'missing', 'up')
+    assert list(sqlite_storage.load()['K1']) == ['A', 'C', 'B']
+    assert list(before['K1']) == ['A', 'B', 'C']
+
+    parts = sqlite_storage.update_kit('K1', lambda parts: kit_batch.apply_batch(parts, delete=['C'], order=['B']))
+    assert list(parts) == ['B', 'A']
+    sqlite_storage.update_kit('K2', lambda parts: {'D': part('D')})
+    sqlite_storage.update_kit('K2', lambda parts: {})
+
+    other = storage.SqliteStorage(path)
+    assert other.load() == sqlite_storage.load() == {'K1': {'B': part('B'), 'A': part('A')}}
+
+
+def test_sqlite_update_kit_writes_nothing_when_update_raises(tmp_path):
+    sqlite_storage = storage.SqliteStorage(str(tmp_path / 'label_data.db'))
+    sqlite_storage.replace_all({'K1': {'A': part('A')}})
+
+    def reject(parts):
+        raise kit_batch.BatchError("rejected")
+
+    with pytest.raises(kit_batch.BatchError):
+        sqlite_storage.update_kit('K1', reject)
+    assert storage.SqliteStorage(sqlite_storage.path).load() == {'K1': {'A': part('A')}}
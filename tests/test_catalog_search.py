@@ -0,0 +1,88 @@
+import catalog_search
+import kit_batch
+
+
+def make_catalog(kits=30, parts=20):
+    words = ("hex bolt nut washer bracket hinge panel cable clamp spring screw "
+             "stainless zinc plated steel m4 m6 m8").split()
+    label_data = {}
+    for kit_index in range(kits):
+        kit_number = f"KIT-{kit_index:05d}"
+        kit = {}
+        for part_index in range(parts):
+            part_number = f"PN-{kit_index:05d}-{part_index:03d}"
+            description = ' '.join(words[(kit_index * 7 + part_index * (offset + 1)) % len(words)]
+                                   for offset in range(4))
+            kit[part_number] = kit_batch.part_entry(part_number, description)
+        label_data[kit_number] = kit
+    return label_data
+
+
+def matching(label_data, query):
+    # Every part each query term is a prefix of some token of
+    terms = catalog_search.tokenize(query)
+    found = set()
+    for kit_number, parts in label_data.items():
+        for part_number, part_data in parts.items():
+            tokens = (catalog_search.tokenize(kit_number) | catalog_search.tokenize(part_number)
+                      | catalog_search.tokenize(part_data['description']))
+            if all(any(token.startswith(term) for token in tokens) for term in terms):
+                found.add((kit_number, part_number))
+    return found
+
+
+def hits(index, query, limit=10 ** 6):
+    return {(kit_number, part_number) for kit_number, part_number, _ in index.search(query, limit)}
+
+
+def test_multi_term_queries_match_every_part():
+    label_data = make_catalog()
+    index = catalog_search.SearchIndex().sync(label_data)
+    for query in ('hex bolt', 'KIT-00004 nut', 'PN-00012-00', 'stainless steel', 'kit-00007 pn'):
+        expected = matching(label_data, query)
+        assert expected
+        assert hits(index, query) == expected
+
+
+def test_terms_expanding_past_max_expansions(monkeypatch):
+    # Every term expands to more tokens than are counted, so no term can
+    # narrow the candidates by posting sets
+    monkeypatch.setattr(catalog_search, 'max_expansions', 5)
+    label_data = make_catalog()
+    index = catalog_search.SearchIndex().sync(label_data)
+    for query in ('kit 0', 'kit-0 pn', 'k p'):
+        expected = matching(label_data, query)
+        assert len(expected) == 600
+        assert hits(index, query) == expected
+        assert len(index.search(query, 20)) == 20
+
+
+def test_exact_tokens_rank_before_prefixes():
+    label_data = {'KIT-1': {'A': kit_batch.part_entry('A', 'hex bolts'),
+                            'B': kit_batch.part_entry('B', 'hex bolt')}}
+    index = catalog_search.SearchIndex().sync(label_data)
+    assert [part_number for _, part_number, _ in index.search('hex bolt')] == ['B', 'A']
+
+
+def test_fuzzy_fallback_finds_misspelled_terms():
+    label_data = make_catalog()
+    index = catalog_search.SearchIndex().sync(label_data)
+    assert hits(index, 'stainles') == matching(label_data, 'stainless')
+    assert hits(index, 'hinge stainlss') == matching(label_data, 'hinge stainless')
+    assert index.search('qqqq') == []
+    # Results do not depend on set iteration order
+    assert index.search('pn-0004-001', 50) == index.search('pn-0004-001', 50)
+
+
+def test_sync_reindexes_changed_kits():
+    label_data = make_catalog(kits=5, parts=5)
+    index = catalog_search.SearchIndex().sync(label_data)
+    changed = dict(label_data)
+    changed['KIT-00001'] = {'NEW-1': kit_batch.part_entry('NEW-1', 'gasket seal')}
+    del changed['KIT-00002']
+    index.sync(changed)
+    assert index.source is changed
+    assert hits(index, 'gasket') == {('KIT-00001', 'NEW-1')}
+    assert not any(kit_number == 'KIT-00002' for kit_number, _ in hits(index, 'kit-00002'))
+    assert hits(index, 'kit-00001') == {('KIT-00001', 'NEW-1')}
+    assert hits(index, 'kit-00003') == matching(changed, 'kit-00003')
@@ -0,0 +1,22 @@
+# Production entry point. Run under gunicorn with the settings in
+# gunicorn.conf.py:
+#
+#   ZPL_PRINT_SECRET_KEY=... gunicorn -c gunicorn.conf.py
+#
+# or point any WSGI server at the factory, e.g. "wsgi:create_app()".
+#
+# The worker process builds its own storage handles, printer connections,
+# print queues and printer monitor, so only one worker process is supported
+# (gunicorn.conf.py fixes workers at 1 and scales with threads). Run it
+# under other WSGI servers in a single process too. Catalog writes are safe
+# across processes anyway:
+# the JSON catalog serializes writers with a file lock (catalog.py) and the
+# SQLite backend with BEGIN IMMEDIATE transactions (storage.py); every process
+# notices the others' changes on its next load.
+
+
+def create_app():
+    # Imported here rather than at module level so nothing (threads, sockets,
+    # database connections) is created before the server forks its workers
+    import app
+    return app.app
@@ -0,0 +1,213 @@
+import hashlib
+import os
+import re
+import struct
+import zlib
+
+import catalog
+import font_metrics
+
+# Pure-Python preview rasterizer for the ZPL subset generate_zpl emits:
+# ^PW/^LL label size, ^FO field origins, ^A0 scalable text, ^FB field blocks,
+# ^BY/^BC Code 128 barcodes and ^FD/^SN field data. Text is drawn with a
+# scaled 5x7 bitmap font spaced with font 0's advance widths (font_metrics),
+# so previews show layout and fit rather than exact glyph shapes. Rendered
+# PNGs are cached on disk keyed by a hash of the ZPL, so a page of thumbnails
+# only renders labels that changed.
+
+preview_dir = "preview_cache"
+
+# 5x7 glyphs for ASCII 32-126, five column bytes each, bit 0 = top row
+_font_5x7 = bytes.fromhex(
+    "000000000000005f00000007000700147f147f14242a7f2a1223130864623649552250"
+    "0005030000001c2241000041221c0014083e081408083e080800503000000808080808"
+    "006060000020100804023e5149453e00427f400042615149462141454b311814127f10"
+    "27454545393c4a49493001710905033649494936064949291e00363600000056360000"
+    "0814224100141414141400412214080201510906324979413e7e1111117e7f49494936"
+    "3e414141227f4141221c7f494949417f090909013e4149497a7f0808087f00417f4100"
+    "2040413f017f081422417f404040407f020c027f7f0408107f3e4141413e7f09090906"
+    "3e4151215e7f09192946464949493101017f01013f4040403f1f2040201f3f4038403f"
+    "631408146307087008076151494543007f41410002040810200041417f000402010204"
+    "4040404040000102040020545454787f484444383844444420384444487f3854545418"
+    "087e0901020c5252523e7f0804047800447d40002040443d007f1028440000417f4000"
+    "7c041804787c0804047838444444387c14141408081414187c7c080404084854545420"
+    "043f4440203c4040207c1c2040201c3c4030403c44281028440c5050503c4464544c44"
+    "000836410000007f000000413608000804081008"
+)
+
+# Code 128 bar/space widths for symbol values 0-106 (106 is the stop symbol)
+_code128 = (
+    "212222 222122 222221 121223 121322 131222 122213 122312 132212 221213 "
+    "221312 231212 112232 122132 122231 113222 123122 123221 223211 221132 "
+    "221231 213212 223112 312131 311222 321122 321221 312212 322112 322211 "
+    "212123 212321 232121 111323 131123 131321 112313 132113 132311 211313 "
+    "231113 231311 112133 112331 132131 113123 113321 133121 313121 211331 "
+    "231131 213113 213311 213131 311123 311321 331121 312113 312311 332111 "
+    "314111 221411 431111 111224 111422 121124 121421 141122 141221 112214 "
+    "112412 122114 122411 142112 142211 241211 221114 413111 241112 134111 "
+    "111242 121142 121241 114212 124112 124211 411212 421112 421211 212141 "
+    "214121 412121 111143 111341 131141 114113 114311 411113 411311 113141 "
+    "114131 311141 411131 211412 211214 211232 2331112"
+).split()
+
+_command = re.compile(r'[\^~]([A-Z@][A-Z0-9@])')
+
+
+class Canvas:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.rows = [bytearray(width) for _ in range(height)]
+
+    def fill(self, x, y, width, height):
+        x0, x1 = max(0, x), min(self.width, x + width)
+        if x1 <= x0:
+            return
+        run = b'\x01' * (x1 - x0)
+        for row in self.rows[max(0, y):min(self.height, y + height)]:
+            row[x0:x1] = run
+
+    def png(self):
+        # 8-bit grayscale, black on white
+        ink = bytes.maketrans(b'\x00\x01', b'\xff\x00')
+        raw = b''.join(b'\x00' + bytes(row).translate(ink) for row in self.rows)
+
+        def chunk(kind, data):
+            return (struct.pack('>I', len(data)) + kind + data
+                    + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+        return (b'\x89PNG\r\n\x1a\n'
+                + chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, 8, 0, 0, 0, 0))
+                + chunk(b'IDAT', zlib.compress(raw, 6))
+                + chunk(b'IEND', b''))
+
+
+def text_width(text, font_width):
+    return font_metrics.text_width(text, font_width)
+
+
+def draw_text(canvas, x, y, text, font_height, font_width):
+    scale_y = font_height / 8
+    left = x
+    for char, advance in zip(text, font_metrics.char_advances(text, font_width)):
+        code = ord(char)
+        # Glyph cell is 6x8 (5x7 plus spacing); scale it to the advance
+        scale_x = advance / 6
+        columns = _font_5x7[(code - 32) * 5:(code - 32) * 5 + 5] if 32 <= code <= 126 else b''
+        for column, bits in enumerate(columns):
+            x0 = round(left + column * scale_x)
+            x1 = round(left + (column + 1) * scale_x)
+            for bit in range(7):
+                if bits & (1 << bit):
+                    y0 = round(y + bit * scale_y)
+                    y1 = round(y + (bit + 1) * scale_y)
+                    canvas.fill(x0, y0, max(1, x1 - x0), max(1, y1 - y0))
+        left += advance
+
+
+def wrap_text(text, max_width, font_width):
+    return font_metrics.wrap_lines(text, max_width, font_width)
+
+
+def code128_modules(data):
+    # Code 128 subset B; returns the bar/space widths in modules
+    values = [ord(char) - 32 for char in data if 32 <= ord(char) <= 126]
+    checksum = (104 + sum(position * value for position, value in enumerate(values, 1))) % 103
+    widths = []
+    for value in [104] + values + [checksum, 106]:
+        widths.extend(int(width) for width in _code128[value])
+    return widths
+
+
+def draw_code128(canvas, x, y, data, height, module_width, interpretation):
+    modules = code128_modules(data)
+    left = x
+    for index, width in enumerate(modules):
+        # Bars and spaces alternate, starting with a bar
+        if index % 2 == 0:
+            canvas.fill(left, y, width * module_width, height)
+        left += width * module_width
+    if interpretation:
+        total = left - x
+        draw_text(canvas, x + (total - text_width(data, 20)) // 2, y + height + 4, data, 20, 20)
+
+
+def _params(text):
+    return [param.strip() for param in text.split(',')]
+
+
+def _int(params, index, default):
+    try:
+        return int(params[index])
+    except (IndexError, ValueError):
+        return default
+
+
+def render_png(zpl_code):
+    # Renders the first label format in zpl_code to PNG bytes
+    if isinstance(zpl_code, bytes):
+        zpl_code = zpl_code.decode('utf-8', 'replace')
+    start = zpl_code.find('^XA')
+    end = zpl_code.find('^XZ', start)
+    body = zpl_code[start + 3:end if end != -1 else None]
+
+    commands = []
+    matches = list(_command.finditer(body))
+    for index, match in enumerate(matches):
+        params_end = matches[index + 1].start() if index + 1 < len(matches) else len(body)
+        commands.append((match.group(1), body[match.end():params_end].strip('\r\n')))
+
+    width = next((_int(_params(p), 0, 609) for c, p in commands if c == 'PW'), 609)
+    height = next((_int(_params(p), 0, 406) for c, p in commands if c == 'LL'), 406)
+    canvas = Canvas(width, height)
+
+    origin = (0, 0)
+    font = (28, 28)
+    block = None
+    barcode = None
+    module_width = 2
+    for command, params_text in commands:
+        params = _params(params_text)
+        if command == 'FO':
+            origin = (_int(params, 0, 0), _int(params, 1, 0))
+        elif command == 'A0':
+            # ^A0N,h,w: params_text starts with the orientation letter
+            font = (_int(params, 1, 28), _int(params, 2, _int(params, 1, 28)))
+        elif command == 'FB':
+            block = (_int(params, 0, 0), _int(params, 1, 1), _int(params, 2, 0),
+                     params[3] if len(params) > 3 and params[3] else 'L')
+        elif command == 'BY':
+            module_width = _int(params, 0, 2)
+        elif command == 'BC':
+            barcode = (_int(params, 1, 50), (params[2] if len(params) > 2 else 'Y') != 'N')
+        elif command in ('FD', 'SN'):
+            data = params_text if command == 'FD' else params[0]
+            x, y = origin
+            if barcode is not None:
+                draw_code128(canvas, x, y, data, barcode[0], module_width, barcode[1])
+            elif block is not None:
+                block_width, max_lines, spacing, justify = block
+                for line_number, line in enumerate(wrap_text(data, block_width, font[1])[:max(1, max_lines)]):
+                    line_x = x
+                    if justify == 'C':
+                        line_x = x + (block_width - text_width(line, font[1])) // 2
+                    elif justify == 'R':
+                        line_x = x + block_width - text_width(line, font[1])
+                    draw_text(canvas, line_x, y + line_number * (font[0] + spacing), line, font[0], font[1])
+            else:
+                draw_text(canvas, x, y, data, font[0], font[1])
+        elif command == 'FS':
+            block = None
+            barcode = None
+    return canvas.png()
+
+
+def preview_path(zpl_code):
+    # Renders zpl_code once and returns the cached PNG's path
+    if isinstance(zpl_code, str):
+        zpl_code = zpl_code.encode()
+    path = os.path.join(preview_dir, hashlib.sha1(zpl_code).hexdigest() + '.png')
+    if not os.path.exists(path):
+        os.makedirs(preview_dir, exist_ok=True)
+        catalog.write_atomic(path, render_png(zpl_code))
+    return path
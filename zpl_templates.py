@@ -0,0 +1,185 @@
+import functools
+import hashlib
+import string
+
+import font_metrics
+
+# Label layouts are compiled once into a %-format string plus the order of its
+# fields, so rendering a label is a single C-level string format. Rendered
+# labels are memoized as bytes: reprinting a kit costs one cache lookup per
+# label.
+#
+# Each layout also exists as a ZPL stored format: the layout is downloaded to
+# printer memory once (^DF) and every label afterwards is a short ^XF recall
+# carrying only the ^FN field values. The transport keeps track of which
+# printer connections already hold which format version.
+#
+# collapse_labels() merges runs of labels before rendering: identical
+# consecutive labels become one format printed with ^PQ<n>, and labels whose
+# part numbers only differ by a counter (ABC-001, ABC-002, ...) become one
+# format whose part number fields count up with ^SN.
+#
+# Part number position and font sizes come from font_metrics.label_fit(),
+# which measures the text with font 0's proportional widths and shrinks
+# fonts that would not fit.
+
+label_cache_size = 8192  # rendered labels kept in memory
+
+
+class LabelLayout:
+    def __init__(self, name, template):
+        self.name = name
+        fields = []
+        pieces = []
+        for literal, field, _, _ in string.Formatter().parse(template):
+            pieces.append(literal.replace('%', '%%'))
+            if field is not None:
+                pieces.append('%s')
+                fields.append(field)
+        self._format = ''.join(pieces)
+        self._fields = tuple(fields)
+
+    def render(self, **values):
+        return self._format % tuple(values[field] for field in self._fields)
+
+
+layouts = {
+    # Part number, description and a Code 128 barcode of the part number
+    'standard': LabelLayout('standard', (
+        "^XA\n"
+        "^PW609\n"
+        "^LL0406\n"
+        "^LS0\n"
+        "^FO{part_x},50^A0N,{part_height},{part_width}{part_number_data}^FS\n"
+        "^FO30,150^FB550,{description_lines},10,C,0^A0N,{description_height},{description_height}"
+        "^FD{description}^FS\n"
+        "^FO50,300^BCN,100,Y,N,N\n"
+        "{part_number_data}^FS\n"
+        "^PQ{quantity},0,1,Y\n"
+        "^XZ\n"
+    )),
+    # Part number and description only
+    'text_only': LabelLayout('text_only', (
+        "^XA\n"
+        "^PW609\n"
+        "^LL0406\n"
+        "^LS0\n"
+        "^FO{part_x},50^A0N,{part_height},{part_width}{part_number_data}^FS\n"
+        "^FO30,150^FB550,{description_lines},10,C,0^A0N,{description_height},{description_height}"
+        "^FD{description}^FS\n"
+        "^PQ{quantity},0,1,Y\n"
+        "^XZ\n"
+    )),
+}
+
+
+class StoredFormat:
+    def __init__(self, name, definition, recall):
+        # name is the printer-side path, e.g. R:STANDARD.ZPL (R: is DRAM and
+        # is cleared when the printer restarts)
+        self.name = name
+        self.definition = definition.encode()
+        self.version = hashlib.sha1(self.definition).hexdigest()[:12]
+        self.recall = LabelLayout(name, recall)
+
+
+# In stored formats the part number is centered by the printer with a
+# one-line ^FB, since the ^FO position cannot vary per label
+stored_formats = {
+    'standard': StoredFormat('R:STANDARD.ZPL', (
+        "^XA\n"
+        "^DFR:STANDARD.ZPL^FS\n"
+        "^PW609\n"
+        "^LL0406\n"
+        "^LS0\n"
+        "^FO0,50^FB609,1,0,C,0^A0N,74,76^FN1^FS\n"
+        "^FO30,150^FB550,5,10,C,0^A0N,28,28^FN2^FS\n"
+        "^FO50,300^BCN,100,Y,N,N\n"
+        "^FN3^FS\n"
+        "^XZ\n"
+    ), (
+        "^XA^XFR:STANDARD.ZPL^FS"
+        "^FN1{part_number_data}^FS^FN2^FD{description}^FS^FN3{part_number_data}^FS"
+        "^PQ{quantity},0,1,Y^XZ\n"
+    )),
+    'text_only': StoredFormat('R:TEXTONLY.ZPL', (
+        "^XA\n"
+        "^DFR:TEXTONLY.ZPL^FS\n"
+        "^PW609\n"
+        "^LL0406\n"
+        "^LS0\n"
+        "^FO0,50^FB609,1,0,C,0^A0N,74,76^FN1^FS\n"
+        "^FO30,150^FB550,5,10,C,0^A0N,28,28^FN2^FS\n"
+        "^XZ\n"
+    ), (
+        "^XA^XFR:TEXTONLY.ZPL^FS"
+        "^FN1{part_number_data}^FS^FN2^FD{description}^FS"
+        "^PQ{quantity},0,1,Y^XZ\n"
+    )),
+}
+
+
+def _part_number_data(part_number, serial):
+    # ^SN prints the starting value and adds 1 per label, keeping leading zeros
+    return f"^SN{part_number},1,Y" if serial else f"^FD{part_number}"
+
+
+@functools.lru_cache(maxsize=label_cache_size)
+def render_label(layout_name, part_number, description, quantity=1, serial=False, fit=None):
+    # fit: the part's font_metrics.label_fit() tuple, if stored with the part
+    part_x, part_height, part_width, description_height, description_lines = (
+        fit or font_metrics.label_fit(part_number, description))
+    layout = layouts[layout_name]
+    zpl_code = layout.render(part_x=part_x, part_height=part_height, part_width=part_width,
+                             part_number_data=_part_number_data(part_number, serial),
+                             description=description, description_height=description_height,
+                             description_lines=description_lines, quantity=quantity)
+    return zpl_code.encode()
+
+
+@functools.lru_cache(maxsize=label_cache_size)
+def render_recall(layout_name, part_number, description, quantity=1, serial=False):
+    # The label as a recall of the layout's stored format
+    return stored_formats[layout_name].recall.render(part_number_data=_part_number_data(part_number, serial),
+                                                     description=description, quantity=quantity).encode()
+
+
+def _split_counter(part_number):
+    # "ABC-0042" -> ("ABC-", 42, 4); None without a trailing number
+    digits = len(part_number) - len(part_number.rstrip('0123456789'))
+    if not digits:
+        return None
+    return part_number[:-digits], int(part_number[-digits:]), digits
+
+
+def counter_part_number(part_number, count):
+    # The part number printed count labels into a ^SN run from part_number
+    prefix, number, digits = _split_counter(part_number)
+    return f"{prefix}{number + count:0{digits}d}"
+
+
+def collapse_labels(labels):
+    # labels: iterable of (part_number, description, quantity) in print order.
+    # Returns [(part_number, description, quantity, serial), ...] where serial
+    # means quantity labels counting up from part_number.
+    batch = []
+    for part_number, description, quantity in labels:
+        if quantity < 1:
+            continue
+        if batch:
+            last_part_number, last_description, last_quantity, last_serial = batch[-1]
+            if description == last_description:
+                if not last_serial and part_number == last_part_number:
+                    batch[-1] = (last_part_number, description, last_quantity + quantity, False)
+                    continue
+                # Only single labels can join a counter run, so every ^SN
+                # value is printed exactly once
+                if quantity == 1 and (last_serial or last_quantity == 1):
+                    last = _split_counter(last_part_number)
+                    current = _split_counter(part_number)
+                    if (last is not None and current is not None and last[0] == current[0]
+                            and last[2] == current[2] and current[1] == last[1] + last_quantity):
+                        batch[-1] = (last_part_number, description, last_quantity + 1, True)
+                        continue
+        batch.append((part_number, description, quantity, False))
+    return batch